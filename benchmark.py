@@ -0,0 +1,309 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+from bitboard import Position
+from board import Board
+from cell import Cell
+from engine import GameEngine, play_game
+from game import GameState
+from geometry import DEFAULT_SIZE, get_geometry
+from memento import Originator, CareTaker
+from player import PlayerWhite, Worker
+from search import random_action, side_of
+import snapshot
+from turn import HeuristicTurn
+
+BASELINE_PATH = 'benchmark_baseline.json'
+# Directory of the entry points started by the startup benchmarks
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Slowdowns beyond this fraction of the baseline time are reported as regressions
+DEFAULT_THRESHOLD = 0.10
+# Rounds played before the fixed positions are taken
+SPARSE_TURNS, DENSE_TURNS = 4, 20
+# Objects created by each memory benchmark; the bytes per object are reported
+MEMORY_OBJECTS = 1000
+
+
+def fixed_position(turns, seed=0, board_size=DEFAULT_SIZE):
+    '''Returns a headless random-vs-random engine after the given number of turns. Seeds are
+    tried in order from the given one until a game lasts that long, so the position is the
+    same on every run'''
+    while True:
+        random.seed(seed)
+        engine = GameEngine('random', 'random', board_size=board_size)
+        while engine.get_game().get_turncount() <= turns and engine.play_turn() is None:
+            pass
+        if engine.get_winner() is None:
+            return engine
+        seed += 1
+
+
+def _enumerate_moves(engine):
+    # Both workers of the player to move, as the server's game state and HeuristicTurn
+    # without NumPy or on large boards ask for them
+    game = engine.get_game()
+    board = game.get_board()
+    workers = game.get_curr_player().get_workers()
+    return lambda: [worker.enumerate_moves(board) for worker in workers]
+
+
+def _best_move_data(engine):
+    game = engine.get_game()
+    turn = HeuristicTurn(game.get_board(), game.get_curr_player(), engine)
+    return turn.get_best_move_data
+
+
+def _win_condition(engine):
+    return engine.get_game().get_board().win_condition_satisfied
+
+
+def _memento_save(engine):
+    # Recording a round and packing it into a memento, as the GUI does after every build
+    game = engine.get_game()
+    originator = Originator(game)
+    worker = game.get_curr_player().get_workers()[0]
+
+    def save():
+        originator.change_state(game)
+        originator.record_move(worker.name, worker.x, worker.y, worker.x, worker.y)
+        originator.record_build(worker.x, worker.y)
+        return originator.save()
+    return save
+
+
+def _memento_undo_redo(engine):
+    # Plays one recorded round, then times undoing and redoing it
+    game = engine.get_game()
+    originator = Originator(game)
+    caretaker = CareTaker(originator)
+    player = game.get_curr_player()
+    index, move_sq, build_sq = random_action(game.get_board().get_bitboard(), side_of(player), random.Random(0))
+    coords = game.get_board().get_geometry().coords
+    worker = game.get_players()[index // 2].get_workers()[index % 2]
+    old_x, old_y = worker.x, worker.y
+    game.move_worker(worker, *coords(move_sq))
+    game.build(*coords(build_sq))
+    game.increment_turn_count()
+    originator.record_move(worker.name, old_x, old_y, *coords(move_sq))
+    originator.record_build(*coords(build_sq))
+    caretaker.do()
+
+    def undo_redo():
+        caretaker.undo()
+        caretaker.redo()
+    return undo_redo
+
+
+def _snapshot_encode(engine):
+    # Packing a game between rounds, as every autosave does
+    game = engine.get_game()
+    return lambda: snapshot.encode(game)
+
+
+def _snapshot_decode(engine):
+    data = snapshot.encode(engine.get_game())
+    return lambda: snapshot.decode(data)
+
+
+def _headless_game(seed, board_size):
+    # Replays the same seeded game on every call
+    return lambda: play_game('random', 'heuristic', seed, board_size=board_size)
+
+
+def _startup(*args):
+    # Starts a fresh interpreter each call, as batch jobs do, so import costs count every time
+    command = [sys.executable, *args]
+    return lambda: subprocess.run(command, cwd=SOURCE_DIR, check=True, stdout=subprocess.DEVNULL)
+
+
+def benchmarks(seed=0, board_size=DEFAULT_SIZE):
+    '''Returns the benchmarks as {name: zero-argument callable}. Every benchmark works on
+    positions fixed by the seed, so runs with the same seed time the same work'''
+    sparse = fixed_position(SPARSE_TURNS, seed, board_size)
+    dense = fixed_position(DENSE_TURNS, seed, board_size)
+    return {
+        'enumerate_moves_sparse': _enumerate_moves(sparse),
+        'enumerate_moves_dense': _enumerate_moves(dense),
+        'best_move_data_sparse': _best_move_data(sparse),
+        'best_move_data_dense': _best_move_data(dense),
+        'win_condition_satisfied': _win_condition(dense),
+        'memento_save': _memento_save(dense),
+        'memento_undo_redo': _memento_undo_redo(fixed_position(DENSE_TURNS, seed, board_size)),
+        'snapshot_encode': _snapshot_encode(dense),
+        'snapshot_decode': _snapshot_decode(dense),
+        'headless_game_random_vs_heuristic': _headless_game(seed, board_size),
+        # Fails if importing the engine loads Tk, which only a window should need
+        'startup_import_engine': _startup('-c', "import sys, engine; sys.exit('tkinter' in sys.modules)"),
+        'startup_headless_game': _startup('main.py', 'random', 'random', '--headless', '1',
+                                          '--seed', str(seed), '--board-size', str(board_size)),
+    }
+
+
+def memory_benchmarks(board_size=DEFAULT_SIZE):
+    '''Returns the memory benchmarks as {name: zero-argument factory}. Each measures the memory
+    kept alive by one object of the board model, which search trees and undo histories multiply'''
+    geometry = get_geometry(board_size)
+    position = Position(geometry)
+    board = Board(board_size)
+    return {
+        'memory_cell': lambda: Cell(1, 1, position),
+        'memory_worker': lambda: Worker('A', 1, 1, geometry),
+        'memory_player': lambda: PlayerWhite(board, 'random'),
+        'memory_board': lambda: Board(board_size),
+        'memory_game_state': lambda: GameState('random', 'random', False, False, board_size=board_size),
+    }
+
+
+def measure_memory(factory, count=MEMORY_OBJECTS):
+    '''Returns the bytes kept alive per object the factory creates, averaged over count objects'''
+    objects = [None] * count
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        for index in range(count):
+            objects[index] = factory()
+        return (tracemalloc.get_traced_memory()[0] - before) / count
+    finally:
+        tracemalloc.stop()
+
+
+def measure(function, repeat=5, min_time=0.2):
+    '''Times the function and returns the best of several runs as seconds per call. Each run
+    makes enough calls to take at least min_time seconds'''
+    timer = timeit.Timer(function)
+    number = 1
+    while timer.timeit(number) < min_time:
+        number *= 2
+    return min(timer.repeat(repeat, number)) / number, number
+
+
+def run(names=None, seed=0, board_size=DEFAULT_SIZE, repeat=5, min_time=0.2, progress=None):
+    '''Runs the benchmarks (all of them, or the given names) and returns the results as a
+    JSON-serializable dict'''
+    suite = benchmarks(seed, board_size)
+    results = {}
+    for name, function in suite.items():
+        if names and name not in names:
+            continue
+        seconds, number = measure(function, repeat, min_time)
+        results[name] = {'seconds': seconds, 'per_second': 1 / seconds, 'calls': number, 'repeat': repeat}
+        if progress is not None:
+            progress(name, results[name])
+    for name, factory in memory_benchmarks(board_size).items():
+        if names and name not in names:
+            continue
+        results[name] = {'bytes': measure_memory(factory)}
+        if progress is not None:
+            progress(name, results[name])
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'seed': seed,
+        'board_size': board_size,
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    '''Returns (name, baseline value, current value, change, status) rows for the benchmarks
+    in both runs, in seconds per call or bytes per object. Change is the relative difference;
+    status is 'regression' or 'improvement' beyond the threshold, else 'unchanged' '''
+    rows = []
+    for name, result in current['results'].items():
+        if name not in baseline['results']:
+            continue
+        unit = 'bytes' if 'bytes' in result else 'seconds'
+        before, after = baseline['results'][name][unit], result[unit]
+        change = after / before - 1
+        if change > threshold:
+            status = 'regression'
+        elif change < -threshold:
+            status = 'improvement'
+        else:
+            status = 'unchanged'
+        rows.append((name, before, after, change, status))
+    return rows
+
+
+def _format_seconds(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f}{unit}"
+    return f"{seconds / 1e-9:.0f}ns"
+
+
+def _format_result(name, value):
+    if name.startswith('memory_'):
+        return f"{value:.0f}B"
+    return _format_seconds(value)
+
+
+def print_report(rows, threshold=DEFAULT_THRESHOLD):
+    '''Prints the comparison against the baseline and a summary line'''
+    print(f"{'benchmark':<36}{'baseline':>11}{'current':>11}{'change':>9}  status")
+    for name, before, after, change, status in rows:
+        print(f"{name:<36}{_format_result(name, before):>11}{_format_result(name, after):>11}{change:>+9.1%}  {status}")
+    regressions = [row[0] for row in rows if row[4] == 'regression']
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) slower than the baseline by more than {threshold:.0%}: "
+              + ', '.join(regressions))
+    else:
+        print(f"\nNo regressions beyond {threshold:.0%}")
+
+
+def parse_args(argv=None):
+    '''Parses command-line arguments'''
+    parser = argparse.ArgumentParser(description="Time the engine's hot paths and compare against a baseline")
+    parser.add_argument('names', nargs='*', metavar='NAME', help="benchmarks to run (default: all)")
+    parser.add_argument('--output', metavar='FILE', help="write the results as JSON to FILE")
+    parser.add_argument('--baseline', default=BASELINE_PATH, metavar='FILE',
+                        help=f"baseline results to compare against (default: {BASELINE_PATH})")
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="store these results as the new baseline instead of comparing")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, metavar='FRACTION',
+                        help=f"slowdown or growth reported as a regression (default: {DEFAULT_THRESHOLD})")
+    parser.add_argument('--seed', type=int, default=0, help="seed fixing the benchmark positions (default: 0)")
+    parser.add_argument('--board-size', type=int, default=DEFAULT_SIZE, metavar='N',
+                        help=f"board size of the benchmark positions (default: {DEFAULT_SIZE})")
+    parser.add_argument('--repeat', type=int, default=5, metavar='N',
+                        help="timed runs per benchmark, the fastest is kept (default: 5)")
+    parser.add_argument('--min-time', type=float, default=0.2, metavar='SECONDS',
+                        help="shortest duration of each timed run (default: 0.2)")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    current = run(args.names, args.seed, args.board_size, args.repeat, args.min_time,
+                  progress=lambda name, result: print(
+                      f"{name:<36}{_format_result(name, result['bytes']):>11}" if 'bytes' in result else
+                      f"{name:<36}{_format_seconds(result['seconds']):>11}{result['per_second']:>14.1f}/s"))
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(current, output_file, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(current, baseline_file, indent=2)
+        print(f"\nSaved baseline to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        print()
+        if (baseline['seed'], baseline['board_size']) != (current['seed'], current['board_size']):
+            print(f"Warning: the baseline was taken with seed {baseline['seed']} on a "
+                  f"{baseline['board_size']}x{baseline['board_size']} board\n")
+        rows = compare(current, baseline, args.threshold)
+        print_report(rows, args.threshold)
+        if any(row[4] == 'regression' for row in rows):
+            sys.exit(1)
+    else:
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to create one")
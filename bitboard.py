@@ -0,0 +1,252 @@
+import functools
+import random
+from geometry import get_geometry
+
+WORKER_NAMES = ('A', 'B', 'Y', 'Z')
+WORKER_INDEX = {name: index for index, name in enumerate(WORKER_NAMES)}
+
+
+class ZobristKeys:
+    '''Zobrist keys for one board size, drawn from a fixed seed so hashes are stable across
+    runs and processes. Height 0 and an off-board worker hash to 0, which makes the empty
+    board hash to 0'''
+    def __init__(self, squares):
+        self.squares = squares
+        rng = random.Random(0x5A4E7051 if squares == 25 else 0x5A4E7051 + squares)
+        self.height = tuple((0,) + tuple(rng.getrandbits(64) for _ in range(4)) for _ in range(squares))
+        self.worker = tuple(tuple(rng.getrandbits(64) for _ in range(squares)) for _ in WORKER_NAMES)
+        self.side = rng.getrandbits(64)
+
+    def __reduce__(self):
+        # Pickled as its board's square count, like Geometry
+        return get_zobrist_keys, (self.squares,)
+
+
+@functools.lru_cache(maxsize=None)
+def get_zobrist_keys(squares):
+    '''Returns the Zobrist keys for a board with the given number of squares'''
+    return ZobristKeys(squares)
+
+
+def iter_bits(mask):
+    '''Yields the square index of every bit set in the mask'''
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class Position:
+    '''Compact bitboard representation of a board position.
+    levels[k] has the bit of every square whose height is greater than k, so a square of
+    height 4 (a dome) is set in all four planes. workers[i] is the square of worker
+    WORKER_NAMES[i], or None if the worker is not on the board.
+    The win condition, the Zobrist hash of heights and worker squares and a legal-move index
+    are kept up to date as workers are placed and buildings raised, so end-of-game checks,
+    move generation and position lookups never rescan the board. The index holds
+    buildable, the mask of squares that are neither occupied nor domed, and reach[i], the
+    mask of squares worker i can move to; a change to a square only refreshes the workers
+    standing on it or next to it.
+    geometry holds the board size's neighbor tables; the standard 5x5 board by default'''
+    def __init__(self, geometry=None):
+        self.geometry = geometry or get_geometry()
+        self._neighbor_masks = self.geometry.neighbor_masks
+        self._keys = get_zobrist_keys(self.geometry.squares)
+        self.levels = [0, 0, 0, 0]
+        self.workers = [None, None, None, None]
+        self.occupied = 0
+        self.hash = 0
+        self.won = False
+        self.buildable = (1 << self.geometry.squares) - 1
+        self.reach = [0, 0, 0, 0]
+
+    def copy(self):
+        '''Returns an independent copy of the position'''
+        position = Position.__new__(Position)
+        position.geometry = self.geometry
+        position._neighbor_masks = self._neighbor_masks
+        position._keys = self._keys
+        position.levels = self.levels[:]
+        position.workers = self.workers[:]
+        position.occupied = self.occupied
+        position.hash = self.hash
+        position.won = self.won
+        position.buildable = self.buildable
+        position.reach = self.reach[:]
+        return position
+
+    def height(self, sq):
+        '''Returns the height of the building on the given square'''
+        levels = self.levels
+        return ((levels[0] >> sq) & 1) + ((levels[1] >> sq) & 1) \
+            + ((levels[2] >> sq) & 1) + ((levels[3] >> sq) & 1)
+
+    def key(self, side):
+        '''Returns the Zobrist hash of the position with the given side (0 white, 1 blue) to move'''
+        return self.hash ^ self._keys.side if side else self.hash
+
+    def occupant(self, sq):
+        '''Returns the name of the worker on the given square, or None'''
+        if not (self.occupied >> sq) & 1:
+            return None
+        for index, worker_sq in enumerate(self.workers):
+            if worker_sq == sq:
+                return WORKER_NAMES[index]
+
+    def place(self, worker_name, sq):
+        '''Places the named worker on the given square'''
+        self.move_worker(WORKER_INDEX[worker_name], sq)
+
+    def move_worker(self, index, sq):
+        '''Places worker WORKER_NAMES[index] on the given square, leaving its old square'''
+        changed = 1 << sq
+        keys = self._keys.worker[index]
+        if self.workers[index] is not None:
+            changed |= 1 << self.workers[index]
+            self.occupied &= ~(1 << self.workers[index])
+            # A worker never stands on a dome, so the square it leaves can be built on
+            self.buildable |= 1 << self.workers[index]
+            self.hash ^= keys[self.workers[index]]
+        self.workers[index] = sq
+        self.occupied |= 1 << sq
+        self.buildable &= ~(1 << sq)
+        self.hash ^= keys[sq]
+        self._update_won()
+        self._update_index(changed)
+
+    def remove(self, sq):
+        '''Removes whichever worker occupies the given square'''
+        for index, worker_sq in enumerate(self.workers):
+            if worker_sq == sq:
+                self.workers[index] = None
+                self.reach[index] = 0
+                self.hash ^= self._keys.worker[index][sq]
+        self.occupied &= ~(1 << sq)
+        self.buildable |= 1 << sq
+        self._update_won()
+        self._update_index(1 << sq)
+
+    def build(self, sq):
+        '''Raises the building on the given square by one level'''
+        bit = 1 << sq
+        levels = self.levels
+        for level in range(4):
+            if not levels[level] & bit:
+                levels[level] |= bit
+                keys = self._keys.height[sq]
+                self.hash ^= keys[level] ^ keys[level + 1]
+                break
+        if levels[3] & bit:
+            self.buildable &= ~bit
+        if self.occupied & bit:
+            self._update_won()
+        self._update_index(bit)
+
+    def unbuild(self, sq):
+        '''Lowers the building on the given square by one level, undoing build'''
+        bit = 1 << sq
+        levels = self.levels
+        for level in range(3, -1, -1):
+            if levels[level] & bit:
+                levels[level] &= ~bit
+                keys = self._keys.height[sq]
+                self.hash ^= keys[level + 1] ^ keys[level]
+                break
+        if not (levels[3] | self.occupied) & bit:
+            self.buildable |= bit
+        if self.occupied & bit:
+            self._update_won()
+        self._update_index(bit)
+
+    def play(self, index, move_sq, build_sq):
+        '''Moves worker WORKER_NAMES[index] to move_sq and builds on build_sq.
+        Returns the square the worker moved from, which undo needs'''
+        from_sq = self.workers[index]
+        self.move_worker(index, move_sq)
+        self.build(build_sq)
+        return from_sq
+
+    def undo(self, index, from_sq, build_sq):
+        '''Reverts play(index, move_sq, build_sq), which returned from_sq'''
+        self.unbuild(build_sq)
+        self.move_worker(index, from_sq)
+
+    def _update_won(self):
+        # Only squares holding a worker can satisfy the win condition
+        self.won = bool(self.occupied & self.levels[2] & ~self.levels[3])
+
+    def _update_index(self, changed):
+        # A change to a square only affects the moves of workers standing on it or next to it
+        neighbor_masks = self._neighbor_masks
+        for index, worker_sq in enumerate(self.workers):
+            if worker_sq is not None and (neighbor_masks[worker_sq] | (1 << worker_sq)) & changed:
+                self.reach[index] = self.move_targets(worker_sq)
+
+    def move_targets(self, sq):
+        '''Returns the mask of squares a worker standing on sq can move to. For a worker on the
+        board, reach holds the same mask without recomputing it'''
+        height = self.height(sq)
+        targets = self._neighbor_masks[sq] & self.buildable
+        if height <= 2:
+            targets &= ~self.levels[height + 1]
+        return targets
+
+    def build_targets(self, sq, vacated=None):
+        '''Returns the mask of squares a worker standing on sq can build on.
+        vacated is a square the worker has just left, which counts as free'''
+        buildable = self.buildable
+        if vacated is not None:
+            buildable |= 1 << vacated
+        return self._neighbor_masks[sq] & buildable
+
+    def is_valid_move(self, old_sq, new_sq):
+        '''Returns True if a worker can move from old_sq to new_sq, ignoring adjacency'''
+        if (self.occupied | self.levels[3]) >> new_sq & 1:
+            return False
+        return self.height(new_sq) <= self.height(old_sq) + 1
+
+    def is_valid_build(self, sq):
+        '''Returns True if the given square can be built on'''
+        return bool(self.buildable >> sq & 1)
+
+    def generate_moves(self, index):
+        '''Returns a list of (move square, build mask) pairs for worker WORKER_NAMES[index]'''
+        targets = self.reach[index]
+        if not targets:
+            return []
+        free = self.buildable | (1 << self.workers[index])
+        neighbor_masks = self._neighbor_masks
+        moves = []
+        while targets:
+            low = targets & -targets
+            move_sq = low.bit_length() - 1
+            moves.append((move_sq, neighbor_masks[move_sq] & free))
+            targets ^= low
+        return moves
+
+    def enumerate_moves(self, worker_name):
+        '''Returns dict of available move directions mapped to their available build directions'''
+        index = WORKER_INDEX[worker_name]
+        sq = self.workers[index]
+        available_move_and_builds = {}
+        targets = self.reach[index]
+        if targets:
+            free = self.buildable | (1 << sq)
+            neighbor_dirs = self.geometry.neighbor_dirs
+            for move_dir, move_sq, move_bit in neighbor_dirs[sq]:
+                if targets & move_bit:
+                    available_move_and_builds[move_dir] = [build_dir for build_dir, _, build_bit in neighbor_dirs[move_sq]
+                                                           if free & build_bit]
+        return available_move_and_builds
+
+    def reachable(self, worker_name):
+        '''Returns the squares the named worker can move to'''
+        return list(iter_bits(self.reach[WORKER_INDEX[worker_name]]))
+
+    def no_moves_left(self, worker_name):
+        '''Returns True if the named worker cannot move'''
+        return not self.reach[WORKER_INDEX[worker_name]]
+
+    def win_condition_satisfied(self):
+        '''Returns True if there is a worker on a square of height 3'''
+        return self.won
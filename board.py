@@ -1,9 +1,25 @@
+from bitboard import Position
 from cell import Cell
+from geometry import DEFAULT_SIZE, get_geometry
 
 class Board:
-    '''Represents the Santorini board, a 5x5 grid of cells'''
-    def __init__(self):
-        self._cells = [[Cell(x, y) for y in range(5)] for x in range(5)]
+    '''Represents the Santorini board, an NxN grid of cells (5x5 by default)'''
+    def __init__(self, size=DEFAULT_SIZE):
+        self._geometry = get_geometry(size)
+        self._position = Position(self._geometry)
+        self._cells = [[Cell(x, y, self._position) for y in range(size)] for x in range(size)]
+
+    def get_geometry(self):
+        '''Returns the lookup tables for the board's size'''
+        return self._geometry
+
+    def get_size(self):
+        '''Returns the number of cells along each side of the board'''
+        return self._geometry.size
+
+    def get_bitboard(self):
+        '''Returns the bitboard position backing the board's cells'''
+        return self._position
     
     def get_specific_cell(self, x, y):
         '''Returns the cell at the specified x, y coordinate'''
@@ -16,20 +32,17 @@ class Board:
     
     def in_bounds(self, x, y):
         '''Returns True if the given x, y coordinates are in bound with the board'''
-        return 5 > x >= 0 and 5 > y >= 0
+        return self._geometry.in_bounds(x, y)
     
     def win_condition_satisfied(self):
         '''Returns True if there is a worker on a cell of height 3'''
-        for row in self._cells:
-            for cell in row:
-                if cell.get_height() == 3 and cell.is_occupied():
-                    return True
-        return False
+        return self._position.win_condition_satisfied()
     
     def __str__(self):
         string = ""
+        separator = "+--" * self._geometry.size + "+"
         for row in self._cells:
-            string += "+--+--+--+--+--+\n"
+            string += separator + "\n"
             row_string = ""
             for cell in row:
                 if cell.is_occupied():
@@ -37,5 +50,5 @@ class Board:
                 else:
                     row_string += f"|{cell.get_height()} "
             string += row_string + "|\n"
-        string += "+--+--+--+--+--+"
+        string += separator
         return string
\ No newline at end of file
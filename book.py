@@ -0,0 +1,167 @@
+import functools
+import mmap
+import os
+import struct
+import time
+from game import GameState
+from geometry import DEFAULT_SIZE
+from search import AlphaBetaSearch, generate_actions
+
+# Book file: magic, format version, board size and entry count, then fixed-size entries
+# sorted by position key, so lookups binary search the memory map without loading it
+MAGIC = b'SBOK'
+VERSION = 1
+HEADER = struct.Struct('<4sBBI')
+# Position key (Zobrist hash with the side to move), worker index, move square, build square
+ENTRY = struct.Struct('<QBBB')
+
+BOOK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PLIES = 1
+DEFAULT_DEPTH = 5
+DEFAULT_TIME_BUDGET = 30.0
+
+
+def book_path(board_size=DEFAULT_SIZE):
+    '''Returns where the opening book of a board size is kept'''
+    return os.path.join(BOOK_DIR, f'opening_book_{board_size}x{board_size}.bin')
+
+
+def start_position(board_size=DEFAULT_SIZE):
+    '''Returns the position every game starts from, white to move'''
+    return GameState('random', 'random', False, False, board_size=board_size).get_board().get_bitboard()
+
+
+class OpeningBook:
+    '''An opening book file, memory-mapped the first time it is consulted'''
+    def __init__(self, path):
+        self._path = path
+        self._map = None
+        self._count = 0
+
+    def _open(self):
+        with open(self._path, 'rb') as book_file:
+            self._map = mmap.mmap(book_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.board_size, self._count = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{self._path} is not an opening book of version {VERSION}")
+
+    def __len__(self):
+        if self._map is None:
+            self._open()
+        return self._count
+
+    def lookup(self, position, side):
+        '''Returns the book's (worker index, move square, build square) action for the side to
+        move, or None if the position is not in the book'''
+        if self._map is None:
+            self._open()
+        if position.geometry.size != self.board_size:
+            return None
+        key = position.key(side)
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            entry_key = ENTRY.unpack_from(self._map, HEADER.size + middle * ENTRY.size)[0]
+            if entry_key < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self._count:
+            return None
+        entry_key, index, move_sq, build_sq = ENTRY.unpack_from(self._map, HEADER.size + low * ENTRY.size)
+        if entry_key != key:
+            return None
+        # Guard against a hash collision with a position where the move is not legal
+        for legal_sq, build_mask in position.generate_moves(index):
+            if legal_sq == move_sq:
+                return (index, move_sq, build_sq) if build_mask >> build_sq & 1 else None
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def get_book(board_size=DEFAULT_SIZE):
+    '''Returns the opening book of a board size, or None if none has been generated'''
+    path = book_path(board_size)
+    if not os.path.exists(path):
+        return None
+    return OpeningBook(path)
+
+
+def book_positions(board_size=DEFAULT_SIZE, plies=DEFAULT_PLIES):
+    '''Returns every position reachable from the start within the given number of plies, as
+    (key, side to move, actions played from the start), without duplicates or finished games'''
+    position = start_position(board_size)
+    frontier = [((), 0)]
+    seen = {position.key(0)}
+    positions = [(position.key(0), 0, ())]
+    for _ in range(plies):
+        next_frontier = []
+        for path, side in frontier:
+            current = position.copy()
+            for action in path:
+                current.play(*action)
+            for action in generate_actions(current, side):
+                child = current.copy()
+                child.play(*action)
+                key = child.key(1 - side)
+                if key in seen or child.won:
+                    continue
+                seen.add(key)
+                next_frontier.append((path + (action,), 1 - side))
+                positions.append((key, 1 - side, path + (action,)))
+        frontier = next_frontier
+    return positions
+
+
+def _search_job(job):
+    # Runs in a pool worker: replays the path from the start and searches the position
+    key, side, path, board_size, depth, time_budget = job
+    position = start_position(board_size)
+    for action in path:
+        position.play(*action)
+    return key, AlphaBetaSearch(time_budget, depth).search(position, side)
+
+
+def generate(path, board_size=DEFAULT_SIZE, plies=DEFAULT_PLIES, depth=DEFAULT_DEPTH,
+             time_budget=DEFAULT_TIME_BUDGET, processes=None, progress=None):
+    '''Searches every position within the given plies of the start to the given depth on a
+    process pool and writes the best actions found as an opening book'''
+    # Only generating the book needs a pool; playing just reads it
+    import multiprocessing
+    jobs = [(key, side, moves, board_size, depth, time_budget)
+            for key, side, moves in book_positions(board_size, plies)]
+    entries = []
+    with multiprocessing.Pool(processes) as pool:
+        for done, (key, action) in enumerate(pool.imap_unordered(_search_job, jobs), 1):
+            if action is not None:
+                entries.append((key, *action))
+            if progress is not None:
+                progress(done, len(jobs))
+    entries.sort()
+    with open(path, 'wb') as book_file:
+        book_file.write(HEADER.pack(MAGIC, VERSION, board_size, len(entries)))
+        for entry in entries:
+            book_file.write(ENTRY.pack(*entry))
+    return len(entries)
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Generate the opening book by searching every early position")
+    parser.add_argument('--board-size', type=int, default=DEFAULT_SIZE, metavar='N',
+                        help=f"board size of the book (default: {DEFAULT_SIZE})")
+    parser.add_argument('--plies', type=int, default=DEFAULT_PLIES, metavar='N',
+                        help=f"cover every position up to N plies from the start (default: {DEFAULT_PLIES})")
+    parser.add_argument('--depth', type=int, default=DEFAULT_DEPTH, metavar='PLIES',
+                        help=f"search depth for each book position (default: {DEFAULT_DEPTH})")
+    parser.add_argument('--time-budget', type=float, default=DEFAULT_TIME_BUDGET, metavar='SECONDS',
+                        help=f"longest search per position (default: {DEFAULT_TIME_BUDGET})")
+    parser.add_argument('--workers', type=int, metavar='N', help="search processes (default: all cores)")
+    parser.add_argument('--output', metavar='FILE', help="book file (default: the book used by the AI players)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    count = generate(args.output or book_path(args.board_size), args.board_size, args.plies, args.depth,
+                     args.time_budget, args.workers,
+                     progress=lambda done, total: print(f"\r{done}/{total} positions", end='', flush=True))
+    print(f"\nWrote {count} positions in {time.perf_counter() - start:.0f}s")
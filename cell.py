@@ -1,56 +1,59 @@
 class Cell:
-    """Represents each individual cell within the 5x5 board."""
-    def __init__(self, x, y):
-        self._x = x
-        self._y = y
-        self._height = 0
-        self._occupied_by = None
+    """Represents each individual cell within the board.
+    A cell is a view over one square of the board's bitboard position, addressed by its
+    square index."""
+    __slots__ = ('_sq', '_coords', '_position')
+
+    def __init__(self, x, y, position):
+        self._sq = position.geometry.square(x, y)
+        self._coords = position.geometry.square_coords[self._sq]
+        self._position = position
 
     def build(self):
         '''Increments the height of the cell's building'''
-        self._height += 1
+        self._position.build(self._sq)
+
+    def unbuild(self):
+        '''Decrements the height of the cell's building, undoing a build'''
+        self._position.unbuild(self._sq)
 
     def get_height(self):
         '''Returns the height of the cell's building'''
-        return self._height
+        return self._position.height(self._sq)
+
+    def get_index(self):
+        '''Returns the square index of the cell'''
+        return self._sq
     
     def get_position(self):
         '''Returns the (x, y) coordinate position of the cell'''
-        return [self._x, self._y]
+        return self._coords
     
     def is_occupied(self):
         '''Returns True if the cell has a worker occupying it'''
-        if self._occupied_by is None:
-            return False
-        else:
-            return True
+        return bool((self._position.occupied >> self._sq) & 1)
     
     def occupy(self, worker_name):
         '''Sets a worker as occupying the cell'''
-        self._occupied_by = worker_name
+        self._position.place(worker_name, self._sq)
 
     def get_occupying_worker(self):
         '''Returns the name of the worker occuping the cell'''
-        return self._occupied_by
+        return self._position.occupant(self._sq)
 
     def remove(self):
         '''Removes the worker current occupying the cell'''
-        self._occupied_by = None
+        self._position.remove(self._sq)
 
     def is_valid_move(self, old_cell):
         '''Returns True if worker can move from old cell to new cell (self)'''
-        if (not self.is_occupied()) and \
-            self.get_height() <= old_cell.get_height() + 1 and \
-            self.get_height() < 4:
-            return True
-        else:
-            return False
+        return self._position.is_valid_move(old_cell._sq, self._sq)
         
     def is_valid_build(self, exclude_pos_x=None, exclude_pos_y=None):
         '''Returns True if worker can build at the cell'''
-        if (not self.is_occupied()) and self.get_height() < 4:
+        if self._position.is_valid_build(self._sq):
             return True
-        elif self._x == exclude_pos_x and self._y == exclude_pos_y:
+        elif self._coords == (exclude_pos_x, exclude_pos_y):
             return True
         else:
-            return False
\ No newline at end of file
+            return False
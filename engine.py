@@ -0,0 +1,167 @@
+import random
+import time
+from game import GameState
+from snapshot import decode as decode_snapshot, save as save_snapshot
+from geometry import DEFAULT_SIZE
+from turn import PLAYER_TURNS, transposition_stats
+
+class GameEngine:
+    '''Game manager without a GUI. Owns a GameState and advances it by running
+    AI turn templates against it, so games can be simulated without a display'''
+    # Human players move through calls from outside, such as a game server's clients
+    ALLOW_HUMANS = False
+
+    def __init__(self, playerWhite_type='random', playerBlue_type='random',
+                 playerWhite_settings=None, playerBlue_settings=None, board_size=DEFAULT_SIZE,
+                 record=None, seed=None, snapshot=None, autosave=None):
+        if snapshot is not None:
+            # Resume a saved game; its player types and board size replace the given ones
+            self._game = decode_snapshot(snapshot, False, False, playerWhite_settings, playerBlue_settings)
+            playerWhite_type, playerBlue_type = self._game.get_white().type, self._game.get_blue().type
+            # A record replays a game from its first turn, which a resumed game does not have
+            record = None
+        else:
+            self._game = GameState(playerWhite_type, playerBlue_type, False, False,
+                                   playerWhite_settings, playerBlue_settings, board_size)
+        for player_type in (playerWhite_type, playerBlue_type):
+            if player_type not in PLAYER_TURNS or (player_type == 'human' and not self.ALLOW_HUMANS):
+                raise ValueError(f"Headless games need AI players, got '{player_type}'")
+        self._player = self._alternate_player()
+        self._game.set_curr_player(self._player)
+        # A saved game may have ended already
+        self._winner = self._game.get_winner(self._player) if snapshot is not None else None
+        # Recorder of this game's turns when games are written to a record file
+        self._record = record.new_game(playerWhite_type, playerBlue_type, board_size, seed) if record else None
+        # Path a snapshot of the game is written to at the start of every round, if any
+        self._autosave = autosave
+        self._checkpoint()
+
+    def play(self):
+        '''Plays turns until the game ends and returns the winning color'''
+        while self._winner is None:
+            self.play_turn()
+        return self._winner
+
+    def play_turn(self):
+        '''Runs the current player's turn. Returns the winning color if the game has ended, else None'''
+        PLAYER_TURNS[self._player.type](self._game.get_board(), self._player, self).run()
+        return self._winner
+
+    def move(self, row, col, old_row, old_col, worker):
+        '''Move specified worker to a new cell'''
+        self._game.move_worker(worker, row, col)
+        if self._record is not None:
+            self._record.record_move(worker.name, old_row, old_col, row, col)
+
+    def build(self, row, col):
+        '''Build in the specified cell and advance to the next round'''
+        self._game.build(row, col)
+        if self._record is not None:
+            self._record.record_build(row, col)
+        self._next_round()
+
+    def check_game_end(self, player, othercondition=False):
+        '''Records the winner if the game has ended with the given player to move'''
+        self._winner = self._game.get_winner(player, othercondition)
+        if self._winner is not None and self._record is not None:
+            self._record.finish(self._winner)
+            self._record = None
+
+    def get_both_players(self):
+        '''Returns both players'''
+        return self._game.get_players()
+
+    def get_game(self):
+        '''Returns the game state'''
+        return self._game
+
+    def get_winner(self):
+        '''Returns the winning color, or None while the game is in progress'''
+        return self._winner
+
+    # Update state to the next round
+    def _next_round(self):
+        self._game.increment_turn_count()
+        self._player = self._alternate_player()
+        self._game.set_curr_player(self._player)
+        self._checkpoint()
+        self.check_game_end(self._player)
+
+    # Save the game between rounds, so a crashed game can be resumed from its last round
+    def _checkpoint(self):
+        if self._autosave is not None:
+            save_snapshot(self._game, self._autosave)
+
+    # Change players
+    def _alternate_player(self):
+        if self._game.get_turncount() % 2 == 1:
+            return self._game.get_white()
+        else:
+            return self._game.get_blue()
+
+
+def play_game(playerWhite_type, playerBlue_type, seed=None,
+              playerWhite_settings=None, playerBlue_settings=None, board_size=DEFAULT_SIZE, record=None,
+              snapshot=None, autosave=None):
+    '''Plays one headless game and returns the winning color and the final turn count.
+    With a RecordWriter as record, the game is appended to its record file. With a snapshot,
+    the saved game is played on instead of a new one; with an autosave path, a snapshot is
+    written there every round'''
+    engine, winner = _play_engine(playerWhite_type, playerBlue_type, seed, playerWhite_settings,
+                                  playerBlue_settings, board_size, record, snapshot, autosave)
+    return winner, engine.get_game().get_turncount()
+
+
+def _play_engine(playerWhite_type, playerBlue_type, seed, playerWhite_settings, playerBlue_settings,
+                 board_size, record, snapshot, autosave):
+    # Plays one headless game and returns its engine, for its players, and the winning color
+    if seed is not None:
+        random.seed(seed)
+    engine = GameEngine(playerWhite_type, playerBlue_type, playerWhite_settings, playerBlue_settings, board_size,
+                        record, seed, snapshot, autosave)
+    return engine, engine.play()
+
+
+def _add_table_stats(total, stats):
+    # Sums the transposition table counters of one player over the games
+    if stats is None:
+        return total
+    if total is None:
+        return dict(stats)
+    for name in ('hits', 'misses', 'stores'):
+        total[name] += stats[name]
+    probes = total['hits'] + total['misses']
+    total['hit_rate'] = total['hits'] / probes if probes else 0.0
+    return total
+
+
+def play_games(playerWhite_type, playerBlue_type, games, seed=None,
+               playerWhite_settings=None, playerBlue_settings=None, board_size=DEFAULT_SIZE, record=None,
+               snapshot=None, autosave=None):
+    '''Plays the given number of headless games and returns a summary of the results. With a
+    snapshot, every game is played on from the saved game. For players whose searches use a
+    transposition table, the summary holds its counters summed over the games'''
+    results = {'white': 0, 'blue': 0}
+    tables = {'white': None, 'blue': None}
+    total_turns = 0
+    start = time.perf_counter()
+    for game_index in range(games):
+        engine, winner = _play_engine(playerWhite_type, playerBlue_type,
+                                      seed + game_index if seed is not None else None,
+                                      playerWhite_settings, playerBlue_settings, board_size, record,
+                                      snapshot, autosave)
+        results[winner] += 1
+        total_turns += engine.get_game().get_turncount()
+        for player in engine.get_game().get_players():
+            tables[player.color] = _add_table_stats(tables[player.color], transposition_stats(player))
+    elapsed = time.perf_counter() - start
+    return {
+        'games': games,
+        'white_wins': results['white'],
+        'blue_wins': results['blue'],
+        'average_turns': total_turns / games if games else 0,
+        'seconds': elapsed,
+        'games_per_second': games / elapsed if elapsed else 0,
+        'white_table': tables['white'],
+        'blue_table': tables['blue'],
+    }
@@ -1,13 +1,16 @@
 from board import Board
+from geometry import DEFAULT_SIZE
 from player import PlayerWhite, PlayerBlue
 
 class GameState:
     '''Stores a state of a game including the board, players, turn count, and score display'''
-    def __init__(self, playerWhite_type, playerBlue_type, memento, score_display):
-        self._board = Board()
-        self._playerWhite = PlayerWhite(self._board, playerWhite_type)
-        self._playerBlue = PlayerBlue(self._board, playerBlue_type)
+    def __init__(self, playerWhite_type, playerBlue_type, memento, score_display,
+                 playerWhite_settings=None, playerBlue_settings=None, board_size=DEFAULT_SIZE):
+        self._board = Board(board_size)
+        self._playerWhite = PlayerWhite(self._board, playerWhite_type, playerWhite_settings)
+        self._playerBlue = PlayerBlue(self._board, playerBlue_type, playerBlue_settings)
         self._turn_count = 1
+        self._curr_player = None
         self._memento = memento
         self._score_display = score_display
 
@@ -39,10 +42,45 @@ class GameState:
         '''Returns True if the game is displaying the score'''
         return self._score_display
     
+    def move_worker(self, worker, row, col):
+        '''Moves the given worker from its current cell to the cell at row, col'''
+        board = self._board
+        board.get_specific_cell(worker.x, worker.y).remove()
+        board.get_specific_cell(row, col).occupy(worker.name)
+        worker.update_pos(row, col)
+
+    def build(self, row, col):
+        '''Builds one level on the cell at row, col'''
+        self._board.get_specific_cell(row, col).build()
+
+    def unbuild(self, row, col):
+        '''Removes the top level of the cell at row, col, undoing a build'''
+        self._board.get_specific_cell(row, col).unbuild()
+
+    def get_worker(self, name):
+        '''Returns the worker with the given name, whichever player it belongs to'''
+        return self._playerWhite.select_worker(name) or self._playerBlue.select_worker(name)
+
+    def get_winner(self, player, othercondition=False):
+        '''Returns the winning color if the game has ended with the given player to move, else None'''
+        if self._board.win_condition_satisfied() or player.workers_cant_move() or othercondition:
+            if player.color == 'white':
+                return 'blue'
+            return 'white'
+        return None
+
     def increment_turn_count(self):
         '''Increments the game's turn count'''
         self._turn_count += 1
 
+    def decrement_turn_count(self):
+        '''Decrements the game's turn count, undoing a round'''
+        self._turn_count -= 1
+
+    def set_turn_count(self, turn_count):
+        '''Sets the game's turn count, as when a saved game is restored'''
+        self._turn_count = turn_count
+
     def set_curr_player(self, player):
         self._curr_player = player
 
@@ -0,0 +1,86 @@
+import functools
+
+DEFAULT_SIZE = 5
+# Square indices are stored in a byte (game records, undo history), so boards stop at 16x16
+MAX_SIZE = 16
+
+DIRECTION = {
+    'n': {'y': 0, 'x': -1},
+    'ne': {'y': 1, 'x': -1},
+    'e': {'y': 1, 'x': 0},
+    'se': {'y': 1, 'x': 1},
+    's': {'y': 0, 'x': 1},
+    'sw': {'y': -1, 'x': 1},
+    'w': {'y': -1, 'x': 0},
+    'nw': {'y': -1, 'x': -1},
+}
+
+
+class Geometry:
+    '''Lookup tables for an NxN board, built once per board size so move generation and
+    scoring read tables instead of checking bounds or branching.
+    Cells are addressed either as (x, y) coordinates or as square indices x * size + y'''
+    def __init__(self, size):
+        self.size = size
+        self.squares = size * size
+        # The distance score counts down from the largest possible sum of two distances
+        self.max_distance_score = 2 * (size - 1)
+
+        # (x, y) coordinate of every square, shared by the cells of every board of this size
+        self.square_coords = tuple(map(self.coords, range(self.squares)))
+
+        # Every (x, y) cell mapped to its in-bound neighbors as (direction, x, y)
+        self.adjacent = {}
+        for x in range(size):
+            for y in range(size):
+                neighbors = []
+                for dir in DIRECTION:
+                    new_x = x + DIRECTION[dir]['x']
+                    new_y = y + DIRECTION[dir]['y']
+                    if self.in_bounds(new_x, new_y):
+                        neighbors.append((dir, new_x, new_y))
+                self.adjacent[(x, y)] = tuple(neighbors)
+        # Every (x, y) cell mapped to {direction: neighboring (x, y)}
+        self.step = {pos: {dir: (x, y) for dir, x, y in neighbors} for pos, neighbors in self.adjacent.items()}
+
+        # The same neighbors by square: (direction, square, bit) tuples and a single bit mask
+        self.neighbor_dirs = tuple(
+            tuple((dir, self.square(x, y), 1 << self.square(x, y)) for dir, x, y in self.adjacent[self.coords(sq)])
+            for sq in range(self.squares))
+        self.neighbor_masks = tuple(sum(bit for _, _, bit in entries) for entries in self.neighbor_dirs)
+        # Direction label of every (square, neighboring square) step
+        self.direction_between = {(sq, new_sq): dir for sq in range(self.squares)
+                                  for dir, new_sq, _ in self.neighbor_dirs[sq]}
+
+        # Ring level of every square, 0 on the outer ring and increasing towards the center
+        self.ring = tuple(min(x, y, size - 1 - x, size - 1 - y) for x, y in map(self.coords, range(self.squares)))
+        self.ring_level = {self.coords(sq): ring for sq, ring in enumerate(self.ring)}
+        # Chebyshev (king move) distance between every pair of squares
+        self.distance = tuple(
+            tuple(max(abs(x1 - x2), abs(y1 - y2)) for x2, y2 in map(self.coords, range(self.squares)))
+            for x1, y1 in map(self.coords, range(self.squares)))
+
+    def in_bounds(self, x, y):
+        '''Returns True if the given x, y coordinates are on the board'''
+        return 0 <= x < self.size and 0 <= y < self.size
+
+    def square(self, x, y):
+        '''Returns the square index of the given x, y coordinate'''
+        return x * self.size + y
+
+    def coords(self, sq):
+        '''Returns the (x, y) coordinate of the given square index'''
+        return divmod(sq, self.size)
+
+    def __reduce__(self):
+        # Pickled as its board size, so positions sent to other processes do not carry the
+        # tables and each process shares the ones get_geometry built
+        return get_geometry, (self.size,)
+
+
+@functools.lru_cache(maxsize=None)
+def get_geometry(size=DEFAULT_SIZE):
+    '''Returns the lookup tables for an NxN board, building them on first use'''
+    if not 4 <= size <= MAX_SIZE:
+        raise ValueError(f"Board size must be between 4 and {MAX_SIZE}, got {size}")
+    return Geometry(size)
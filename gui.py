@@ -1,81 +1,144 @@
-from decimal import setcontext, BasicContext
+from concurrent.futures import ThreadPoolExecutor
 import tkinter as tk
+import tkinter.filedialog
 import tkinter.messagebox
 from memento import Originator, CareTaker
 from game import GameState
+from snapshot import encode as encode_snapshot, decode as decode_snapshot, read as read_snapshot, \
+    write as write_snapshot
 from tkmacosx import Button
-from turn import HumanTurn, RandomTurn, HeuristicTurn
+from turn import PLAYER_TURNS
+from geometry import DEFAULT_SIZE
 from observer import Subject, EndGameObserver
 
-setcontext(BasicContext)
+# Background of cells a worker can move or build to
+HIGHLIGHT = "#FFFFE0"
+# Milliseconds an AI turn waits before it plays, so AI moves can be followed
+DEFAULT_AI_DELAY = 300
+# Milliseconds between checks on whether an AI decision is ready
+AI_POLL_INTERVAL = 20
+# File types offered when saving and loading games
+SNAPSHOT_FILES = [("Santorini games", "*.snap"), ("All files", "*")]
 
 class SantoriniGUI(Subject):
     '''Game Manager as a GUI'''
 
-    def __init__(self, playerWhite_type='human', playerBlue_type='human', memento=True, score_display=False):
+    def __init__(self, playerWhite_type='human', playerBlue_type='human', memento=True, score_display=False,
+                 playerWhite_settings=None, playerBlue_settings=None, board_size=DEFAULT_SIZE,
+                 ai_delay=DEFAULT_AI_DELAY, record=None, snapshot=None, autosave=None):
         super().__init__()
-        self._game = GameState(playerWhite_type, playerBlue_type, memento, score_display)
+        if snapshot is not None:
+            # Resume a saved game; its player types and board size replace the given ones
+            self._game = decode_snapshot(snapshot, memento, score_display, playerWhite_settings, playerBlue_settings)
+            board_size = self._game.get_board().get_size()
+        else:
+            self._game = GameState(playerWhite_type, playerBlue_type, memento, score_display,
+                                   playerWhite_settings, playerBlue_settings, board_size)
+        self._size = board_size
+        self._ai_delay = ai_delay
+        # Writer of the record file games are appended to, if any
+        self._record_writer = record
+        self._start_record(resumed=snapshot is not None)
+        # Path a snapshot of the game is written to at the start of every round, if any
+        self._autosave = autosave
+        # AI players decide on this thread while the window keeps handling events
+        self._ai_executor = ThreadPoolExecutor(max_workers=1)
         self._game_observer = EndGameObserver()
         self.attach(self._game_observer)
         self._memento = memento
         if memento:
-            self._originator = Originator(self)
-            self._caretaker = CareTaker(self._originator)
+            self._start_history()
         self._score_display = score_display
         self._player = self._alternate_player()
         self._game.set_curr_player(self._player)
+        self._checkpoint()
         self.buttons = []
+        # (text, background) currently shown by each button, so redraws only touch changed cells
+        self._shown = []
 
         self._window = tk.Tk()
         self._window.title("Santorini")
 
+        # Game menu to save and load games
+        menu = tk.Menu(self._window)
+        game_menu = tk.Menu(menu, tearoff=0)
+        game_menu.add_command(label="Save...", command=self._save_game)
+        game_menu.add_command(label="Load...", command=self._load_game)
+        menu.add_cascade(label="Game", menu=game_menu)
+        self._window.config(menu=menu)
+
         # Display turn info
         self._info_frame = tk.Frame(self._window)
         self._info_frame.grid(row=0, column=3, columnspan=3)
+        self._info_label = tk.Label(self._info_frame)
+        self._info_label.grid(row=0, column=0, padx=5, pady=5)
         self._display_turn_info()
 
+        # Display score if enabled
+        self._score_frame = tk.Frame(self._window)
+        self._score_frame.grid(row=0, column=6, columnspan=5)
+        if self._score_display:
+            self._score_labels = [tk.Label(self._score_frame), tk.Label(self._score_frame)]
+            for row, label in enumerate(self._score_labels):
+                label.grid(row=row, column=0, padx=2, pady=2)
+        self._display_score()
+
         # Display board
         self._board_frame = tk.Frame(self._window)
         self._board_frame.grid(row=2, column=1, columnspan=8, sticky="ew")
+        self._create_board()
         self._display_board()
 
         # Display next/undo/redo if enabled
         if self._memento:
             self._memento_frame = tk.Frame(self._window)
             self._memento_frame.grid(row=0, column=1, columnspan=2)
-            self._display_memento()
-        else:
-            self._player_turn()
-
-        # Display score if enabled
-        self._score_frame = tk.Frame(self._window)
-        self._score_frame.grid(row=0, column=6, columnspan=5)
-        self._display_score()
+        # A saved game may have ended already, in which case check_game_end restarts or closes it
+        if not self.check_game_end(self._player):
+            if self._memento:
+                self._display_memento()
+            else:
+                self._player_turn()
 
         self._window.mainloop()
+        self._ai_executor.shutdown(wait=False, cancel_futures=True)
 
     # Update state to the next round and display on window
     def _next_round(self):
         self._increment_turn_count()
         self._player = self._alternate_player()
         self._game.set_curr_player(self._player)
+        self._checkpoint()
         self._display_board()
         self._display_turn_info()
         self._display_score()
+        # If the round ended the game, check_game_end has already restarted or closed it
+        if self.check_game_end(self._player):
+            return
         if self._memento:
             self._display_memento()
         else:
             self._player_turn()
-        self.check_game_end(self._player)
 
-    # Call appropriate turn template based on the player's type
+    # Call appropriate turn template based on the player's type. AI turns decide on a worker
+    # thread and play from a Tk callback, so each round returns to the event loop
     def _player_turn(self):
+        turn = PLAYER_TURNS[self._player.type](self._game.get_board(), self._player, self)
         if self._player.type == 'human':
-            HumanTurn(self._game.get_board(), self._player, self).run()
-        elif self._player.type == 'random':
-            RandomTurn(self._game.get_board(), self._player, self).run()
-        elif self._player.type == 'heuristic':
-            HeuristicTurn(self._game.get_board(), self._player, self).run()
+            turn.run()
+            return
+        self._unbind_buttons()
+        decision = self._ai_executor.submit(turn.decide)
+        self._window.after(self._ai_delay, self._play_ai_turn, turn, decision, self._game)
+
+    # Play an AI turn once its decision is ready, unless the game it was made for was replaced
+    def _play_ai_turn(self, turn, decision, game):
+        if game is not self._game:
+            return
+        if not decision.done():
+            self._window.after(AI_POLL_INTERVAL, self._play_ai_turn, turn, decision, game)
+            return
+        turn.play(decision.result())
 
     # Change players
     def _alternate_player(self):
@@ -84,97 +147,176 @@ class SantoriniGUI(Subject):
         else:
             return self._game.get_blue()
         
-    # Display board
-    def _display_board(self):
-        self.buttons.clear()
-        for row in range(5):
+    # Create the board's buttons, once per window
+    def _create_board(self):
+        for row in range(self._size):
             row_buttons = []
-            for col in range(5):
-                cell = self._game.get_board().get_specific_cell(row, col)
-                text = ''
-                height = cell.get_height()
-                if cell.is_occupied():
-                    text += f"{cell.get_occupying_worker()}"
-                while height > 0:
-                    text += '\n[ ]'
-                    height -= 1
-                button = Button(self._board_frame, text=text, width=100, height=100)
+            for col in range(self._size):
+                button = Button(self._board_frame, text='', width=100, height=100)
                 button.grid(row=row, column=col)
                 row_buttons.append(button)
             self.buttons.append(row_buttons)
+        self._default_bg = self.buttons[0][0].cget('bg')
+        self._shown = [[('', self._default_bg) for col in range(self._size)] for row in range(self._size)]
+
+    # Display board, updating only the buttons whose cell or highlight changed
+    def _display_board(self):
+        board = self._game.get_board()
+        for row in range(self._size):
+            for col in range(self._size):
+                cell = board.get_specific_cell(row, col)
+                text = cell.get_occupying_worker() or ''
+                text += '\n[ ]' * cell.get_height()
+                self._update_button(row, col, text, self._default_bg)
+
+    def _update_button(self, row, col, text, bg):
+        shown_text, shown_bg = self._shown[row][col]
+        changes = {}
+        if text != shown_text:
+            changes['text'] = text
+        if bg != shown_bg:
+            changes['bg'] = bg
+        if changes:
+            self.buttons[row][col].config(**changes)
+            self._shown[row][col] = (text, bg)
+
+    # Highlight a cell the player can move or build to; the next board display clears it
+    def _highlight(self, row, col):
+        self._update_button(row, col, self._shown[row][col][0], HIGHLIGHT)
         
     def check_game_end(self, player, othercondition=False):
-        '''Prompt user to play again and either restarts or exits game'''
-        if self._game.get_board().win_condition_satisfied() or player.workers_cant_move() or othercondition:
-            if player.color == 'white':
-                winner = 'blue'
-            else:
-                winner = 'white'
+        '''Prompt user to play again and either restarts or exits game.
+        Returns True if the game had ended'''
+        winner = self._game.get_winner(player, othercondition)
+        if winner is not None:
+            if self._record is not None:
+                self._record.finish(winner)
             self.notify("end", winner)
             if self._game_observer.restart():
                 # Reset game state
-                self._game = GameState(self._game.get_white().type, self._game.get_blue().type, self._memento, self._score_display)
+                white, blue = self._game.get_white(), self._game.get_blue()
                 self._game_observer = EndGameObserver()
                 self.attach(self._game_observer)
-                self._player = self._alternate_player()
-                self._game.set_curr_player(self._player)
-                # Update GUI
-                self._display_board()
-                self._display_turn_info()
-                self._display_score()
-                if self._memento:
-                    self._display_memento()
-                else:
-                    self._player_turn()
+                self._start_game(GameState(white.type, blue.type, self._memento, self._score_display,
+                                           white.settings, blue.settings, self._size))
             else:
                 self._window.destroy()
                 exit(0)
+            return True
+        return False
     
     def move(self, row, col, old_row, old_col, worker):
         '''Move specified worker to a new cell'''
-        # Remove worker from old cell
-        old_cell = self._game.get_board().get_specific_cell(old_row, old_col)
-        old_cell.remove()
-        
-        # Move worker to new cell
-        new_cell = self._game.get_board().get_specific_cell(row, col)
-        new_cell.occupy(worker.name)
-        worker.update_pos(row, col)
+        # Move worker from its old cell to the new cell
+        self._game.move_worker(worker, row, col)
+        if self._memento:
+            self._originator.record_move(worker.name, old_row, old_col, row, col)
+        if self._record is not None:
+            self._record.record_move(worker.name, old_row, old_col, row, col)
         self._display_board()
 
         # Remove all button functionality and bind build function to valid adjacent buttons
         self._unbind_buttons()
-        adjacent_positions = [
-            (row-1, col-1), (row-1, col), (row-1, col+1),
-            (row, col-1),                 (row, col+1),
-            (row+1, col-1), (row+1, col), (row+1, col+1)
-        ]
-        for adj_row, adj_col in adjacent_positions:
-            if self._game.get_board().in_bounds(adj_row, adj_col):
-                adj_cell = self._game.get_board().get_specific_cell(adj_row, adj_col)
-                if adj_cell.is_valid_build():
-                    self.buttons[adj_row][adj_col].bind("<Button-1>", lambda event, r=adj_row, c=adj_col: self.build(r, c))
-                    self.buttons[adj_row][adj_col].config(bg="#FFFFE0")
+        for _, adj_row, adj_col in self._game.get_board().get_geometry().adjacent[(row, col)]:
+            adj_cell = self._game.get_board().get_specific_cell(adj_row, adj_col)
+            if adj_cell.is_valid_build():
+                self.buttons[adj_row][adj_col].bind("<Button-1>", lambda event, r=adj_row, c=adj_col: self.build(r, c))
+                self._highlight(adj_row, adj_col)
 
     def build(self, row, col):
         '''Build in the specified cell'''
         cell = self._game.get_board().get_specific_cell(row, col)
         if cell.is_valid_build():
-            cell.build()
+            self._game.build(row, col)
+            if self._memento:
+                # The round is complete, log it so it can be undone
+                self._originator.record_build(row, col)
+                self._caretaker.do()
+            if self._record is not None:
+                self._record.record_build(row, col)
             self._next_round()
 
+    # Replace the game in the window and play it from its current round
+    def _start_game(self, game, resumed=False):
+        self._game = game
+        if self._memento:
+            self._start_history()
+        self._start_record(resumed)
+        self._player = self._alternate_player()
+        self._game.set_curr_player(self._player)
+        self._checkpoint()
+        # Update GUI
+        self._display_board()
+        self._display_turn_info()
+        self._display_score()
+        if self.check_game_end(self._player):
+            return
+        if self._memento:
+            self._display_memento()
+        else:
+            self._player_turn()
+
+    # Snapshot the game at the start of each round; a game is saved as of its current round
+    def _checkpoint(self):
+        self._snapshot = encode_snapshot(self._game)
+        if self._autosave is not None:
+            write_snapshot(self._snapshot, self._autosave)
+
+    def _save_game(self):
+        path = tkinter.filedialog.asksaveasfilename(defaultextension='.snap', filetypes=SNAPSHOT_FILES)
+        if not path:
+            return
+        try:
+            write_snapshot(self._snapshot, path)
+        except OSError as error:
+            self._messagebox(f"Could not save the game: {error}")
+
+    def _load_game(self):
+        path = tkinter.filedialog.askopenfilename(filetypes=SNAPSHOT_FILES)
+        if not path:
+            return
+        # Players keep their settings; the player types are the saved game's
+        white, blue = self._game.get_white(), self._game.get_blue()
+        try:
+            game = decode_snapshot(read_snapshot(path), self._memento, self._score_display,
+                                   white.settings, blue.settings)
+        except (OSError, ValueError) as error:
+            self._messagebox(f"Could not load the game: {error}")
+            return
+        if game.get_board().get_size() != self._size:
+            self._messagebox(f"The saved game is played on a different board size ({game.get_board().get_size()})")
+            return
+        if any(player.type not in PLAYER_TURNS for player in game.get_players()):
+            self._messagebox("The saved game has an unknown player type")
+            return
+        self._start_game(game, resumed=True)
+
+    # Start an empty undo/redo history for the current game
+    def _start_history(self):
+        self._originator = Originator(self._game)
+        self._caretaker = CareTaker(self._originator)
+
+    # Start recording the current game's turns if games are being recorded. A resumed game is
+    # not, since a record replays a game from its first turn
+    def _start_record(self, resumed=False):
+        self._record = None
+        if self._record_writer is not None and not resumed:
+            white, blue = self._game.get_white(), self._game.get_blue()
+            self._record = self._record_writer.new_game(white.type, blue.type, self._size)
+
     # Display undo/redo/undo buttons
     def _display_memento(self):
         def _undo():
             if self._caretaker.history_isempty():
                 self._messagebox("No past rounds to undo. Please select a different option")
             else:
-                # Save the current state in case user wants to redo
-                self._originator.change_state(self._game)
-                self._caretaker.do_redo()
-                # Restore the undo game state
+                # Revert the last round, keeping it in case user wants to redo
                 self._game = self._caretaker.undo()
-                self._player = self._game.get_curr_player()
+                if self._record is not None:
+                    self._record.undo()
+                self._player = self._alternate_player()
+                self._game.set_curr_player(self._player)
+                self._checkpoint()
                 # Update window display to restored game state
                 self._display_board()
                 self._display_turn_info()
@@ -185,12 +327,13 @@ class SantoriniGUI(Subject):
             if self._caretaker.undone_isempty():
                 self._messagebox("No past rounds to redo. Please select a different option")
             else:
-                # Save the current state in case user wants to undo again
-                self._originator.change_state(self._game)
-                self._caretaker.do()
-                # Restore the redo game state
+                # Replay the last undone round, keeping it in case user wants to undo again
                 self._game = self._caretaker.redo()
-                self._player = self._game.get_curr_player()
+                if self._record is not None:
+                    self._record.redo()
+                self._player = self._alternate_player()
+                self._game.set_curr_player(self._player)
+                self._checkpoint()
                 # Update window display to restored game state
                 self._display_board()
                 self._display_turn_info()
@@ -198,10 +341,10 @@ class SantoriniGUI(Subject):
                 self._require_memento_selection()
             
         def _next():
-            # Save the current state
-            self._originator.change_state(self._game)
-            self._caretaker.do()
+            # Playing on discards the undone rounds; the round played is logged when it is built
             self._caretaker.clear_undone()
+            if self._record is not None:
+                self._record.clear_undone()
             _destory_memento()
             self._player_turn()
 
@@ -209,6 +352,8 @@ class SantoriniGUI(Subject):
             for widget in self._memento_frame.winfo_children():
                 widget.destroy()
 
+        # Replace any Undo/Redo/Next buttons left from an earlier round
+        _destory_memento()
         self._require_memento_selection()
         tk.Button(self._memento_frame, text="Undo",
                 command=_undo).grid(row=1, column=1)
@@ -221,14 +366,14 @@ class SantoriniGUI(Subject):
 
     # Alerts player to select undo/redo/next before they can make a move
     def _require_memento_selection(self):
-        for row in range(5):
-                for col in range(5):
+        for row in range(self._size):
+                for col in range(self._size):
                     self.buttons[row][col].bind("<Button-1>", lambda event: self._messagebox("Please select undo/redo/next"))
     
     # Replaces any previous button functionality and prevents player from selecting these buttons
     def _unbind_buttons(self):
-        for row in range(5):
-            for col in range(5):
+        for row in range(self._size):
+            for col in range(self._size):
                 self.buttons[row][col].bind("<Button-1>", lambda event: self._messagebox("You cannot select this space"))
 
     def _messagebox(self, message):
@@ -236,20 +381,17 @@ class SantoriniGUI(Subject):
 
     def _display_turn_info(self):
         info = f"Turn: {self._game.get_turncount()}, {self._player.color} ({self._player.workers})"
-        info_label = tk.Label(self._info_frame, text=str(info))
-        info_label.grid(row=0, column=0, padx=5, pady=5)
+        self._info_label.config(text=info)
 
     def _display_score(self):
         if self._score_display:
             data_white = self.get_curr_move_data(self._game.get_white())
             score_white = f'white score: {data_white[0]}, {data_white[1]}, {data_white[2]}'
-            score_white_label = tk.Label(self._score_frame, text=str(score_white))
-            score_white_label.grid(row=0, column=0, padx=2, pady=2)
+            self._score_labels[0].config(text=score_white)
 
             data_blue = self.get_curr_move_data(self._game.get_blue())
             score_blue = f'blue score: {data_blue[0]}, {data_blue[1]}, {data_blue[2]}'
-            score_blue_label = tk.Label(self._score_frame, text=str(score_blue))
-            score_blue_label.grid(row=1, column=0, padx=2, pady=2)
+            self._score_labels[1].config(text=score_blue)
         
     def _increment_turn_count(self):
         self._game.increment_turn_count()
@@ -283,6 +425,7 @@ class SantoriniGUI(Subject):
         blue_workers = players[1].get_workers()
         worker_Y = blue_workers[0]
         worker_Z = blue_workers[1]
+        max_distance_score = self._game.get_board().get_geometry().max_distance_score
 
         distance_AZ = self._calculate_curr_distance(worker_A, worker_Z)
         distance_BY = self._calculate_curr_distance(worker_B, worker_Y)
@@ -290,9 +433,9 @@ class SantoriniGUI(Subject):
         distance_AY = self._calculate_curr_distance(worker_A, worker_Y)
         distance_BZ = self._calculate_curr_distance(worker_B, worker_Z)
         if player.color == 'white':
-            return 8 - (min(distance_BY, distance_AY) + min(distance_BZ, distance_AZ))
+            return max_distance_score - (min(distance_BY, distance_AY) + min(distance_BZ, distance_AZ))
         elif player.color == 'blue':
-            return 8 - (min(distance_AZ, distance_AY) + min(distance_BY, distance_BZ))
+            return max_distance_score - (min(distance_AZ, distance_AY) + min(distance_BY, distance_BZ))
         
     def get_curr_move_data(self, player):
         '''Creates a tuple containing current height, center, distance score'''
@@ -307,4 +450,8 @@ class SantoriniGUI(Subject):
     
     def get_both_players(self):
         '''Returns both players'''
-        return self._game.get_players()
\ No newline at end of file
+        return self._game.get_players()
+
+    def get_game(self):
+        '''Returns the game state'''
+        return self._game
\ No newline at end of file
@@ -0,0 +1,195 @@
+import atexit
+import cProfile
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from array import array
+from bitboard import Position
+from memento import CareTaker
+from player import Worker
+from turn import PLAYER_TURNS
+
+# Environment variables that turn instrumentation on without the main.py flags
+TIMINGS_ENV = 'SANTORINI_TIMINGS'
+CPROFILE_ENV = 'SANTORINI_CPROFILE'
+
+# Phases shown in the summary, in this order
+PHASES = ('turn', 'movegen', 'move', 'build', 'display', 'memento', 'check_game_end')
+
+# The active recorder, or None while instrumentation is off
+_recorder = None
+
+
+def percentile(values, fraction):
+    '''Returns the value at the given fraction (0..1) of the sorted values'''
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class Recorder:
+    '''Times the phases of each round and writes one JSON line per round. Each phase records
+    its own time only: time spent in instrumented calls it makes, such as an AI turn calling
+    move and build, is counted towards those phases instead'''
+    def __init__(self, timings_path=None, cprofile_dir=None):
+        self._timings_file = open(timings_path, 'a') if timings_path else None
+        self._cprofile_dir = cprofile_dir
+        self._profiler = None
+        self._game = None
+        self._game_index = 0
+        # [start, time spent in instrumented calls] of every instrumented call in progress, per
+        # thread, as the GUI makes AI decisions on a worker thread
+        self._local = threading.local()
+        self._round = {}
+        self._round_calls = {}
+        self._round_info = None
+        self._samples = {phase: array('d') for phase in PHASES}
+
+    def watch(self, manager):
+        '''Notices when the manager has moved on to a new game'''
+        game = manager.get_game()
+        if game is not self._game:
+            self._end_game()
+            self._game = game
+            self._game_index += 1
+            if self._cprofile_dir:
+                self._profiler = cProfile.Profile()
+                self._profiler.enable()
+
+    def start_round(self, manager):
+        '''Notes the turn and player of the round being built'''
+        game = manager.get_game()
+        self._round_info = (game.get_turncount(), game.get_curr_player().color)
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def enter(self):
+        self._stack().append([time.perf_counter(), 0.0])
+
+    def exit(self, phase):
+        stack = self._stack()
+        start, nested = stack.pop()
+        elapsed = time.perf_counter() - start
+        own = elapsed - nested
+        if stack:
+            stack[-1][1] += elapsed
+        self._samples[phase].append(own)
+        self._round[phase] = self._round.get(phase, 0.0) + own
+        self._round_calls[phase] = self._round_calls.get(phase, 0) + 1
+        # Write the round once the outermost call of its build has returned
+        if not stack and self._round_info is not None:
+            self._write_round()
+
+    def _write_round(self):
+        turn, color = self._round_info or (None, None)
+        if self._timings_file is not None and self._round:
+            self._timings_file.write(json.dumps({
+                'game': self._game_index,
+                'turn': turn,
+                'player': color,
+                'seconds': self._round,
+                'calls': self._round_calls,
+            }) + '\n')
+        self._round = {}
+        self._round_calls = {}
+        self._round_info = None
+
+    def _end_game(self):
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(os.path.join(self._cprofile_dir, f'game-{self._game_index}.prof'))
+            self._profiler = None
+
+    def close(self):
+        '''Writes any unfinished round, dumps the last game's profile and prints the summary'''
+        if self._round:
+            self._write_round()
+        self._end_game()
+        if self._timings_file is not None:
+            self._timings_file.close()
+        self.print_summary()
+
+    def print_summary(self, file=sys.stderr):
+        '''Prints call counts, totals and percentiles of each phase, in milliseconds'''
+        print(f"{'phase':<16}{'calls':>9}{'total':>11}{'mean':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}",
+              file=file)
+        for phase in PHASES:
+            values = sorted(self._samples[phase])
+            if not values:
+                continue
+            total = sum(values)
+            print(f"{phase:<16}{len(values):>9}{total * 1e3:>11.1f}{total / len(values) * 1e3:>9.3f}"
+                  f"{percentile(values, 0.5) * 1e3:>9.3f}{percentile(values, 0.9) * 1e3:>9.3f}"
+                  f"{percentile(values, 0.99) * 1e3:>9.3f}{values[-1] * 1e3:>9.3f}", file=file)
+
+
+def _timed(function, phase, manager_of=None):
+    # Wraps a function so each call is timed as the phase. manager_of returns the game
+    # manager from the call's first argument, for calls that can start a game or a round
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        recorder = _recorder
+        if recorder is None:
+            return function(*args, **kwargs)
+        if manager_of is not None:
+            manager = manager_of(args[0])
+            recorder.watch(manager)
+            if phase == 'build':
+                recorder.start_round(manager)
+        recorder.enter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            recorder.exit(phase)
+    return wrapper
+
+
+def _install(owner, name, phase, manager_of=None):
+    function = owner.__dict__[name]
+    if not hasattr(function, '__wrapped__'):
+        setattr(owner, name, _timed(function, phase, manager_of))
+
+
+def instrument_manager(manager_class):
+    '''Times the move, build, redraw and game-end phases of a game manager class, such as
+    SantoriniGUI or GameEngine'''
+    manager_of = lambda manager: manager
+    for name, phase in (('move', 'move'), ('build', 'build'), ('_display_board', 'display'),
+                        ('check_game_end', 'check_game_end')):
+        if name in manager_class.__dict__:
+            _install(manager_class, name, phase, manager_of)
+
+
+def enable(timings_path=None, cprofile_dir=None, manager_class=None):
+    '''Turns instrumentation on: wraps the instrumented functions, writes a JSON line of phase
+    times per round to timings_path, dumps a cProfile of each game into cprofile_dir, and
+    prints a summary of every phase at exit'''
+    global _recorder
+    if _recorder is not None:
+        return
+    if cprofile_dir:
+        os.makedirs(cprofile_dir, exist_ok=True)
+    # AI turns are timed while deciding, human turns while binding the board
+    for turn_class in set(PLAYER_TURNS.values()):
+        for name in ('decide', 'run'):
+            if name in turn_class.__dict__:
+                _install(turn_class, name, 'turn', lambda turn: turn._gui)
+    _install(Worker, 'enumerate_moves', 'movegen')
+    _install(Position, 'generate_moves', 'movegen')
+    _install(CareTaker, 'do', 'memento')
+    if manager_class is not None:
+        instrument_manager(manager_class)
+    _recorder = Recorder(timings_path, cprofile_dir)
+    atexit.register(_recorder.close)
+
+
+def enable_from_environment(manager_class=None):
+    '''Turns instrumentation on if SANTORINI_TIMINGS or SANTORINI_CPROFILE is set'''
+    timings_path = os.environ.get(TIMINGS_ENV)
+    cprofile_dir = os.environ.get(CPROFILE_ENV)
+    if timings_path or cprofile_dir:
+        enable(timings_path, cprofile_dir, manager_class)
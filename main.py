@@ -1,33 +1,193 @@
-import sys
-from gui import SantoriniGUI
+import argparse
+import os
+from turn import PLAYER_TURNS
+from geometry import DEFAULT_SIZE, MAX_SIZE
+
+
+def weights_argument(text):
+    '''Parses heuristic weights given as HEIGHT,CENTER,DISTANCE or as the path of a weights file'''
+    if os.path.exists(text):
+        from tune import load_weights
+        return load_weights(text)
+    try:
+        weights = tuple(float(weight) for weight in text.split(','))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{text}' is neither a weights file nor HEIGHT,CENTER,DISTANCE")
+    if len(weights) != 3:
+        raise argparse.ArgumentTypeError(f"expected three weights, got {len(weights)}")
+    return weights
+
+
+def parse_args(argv=None):
+    '''Parses command-line arguments'''
+    parser = argparse.ArgumentParser(description="Play Santorini in a window, or headless between AI players")
+    parser.add_argument('white', nargs='?', default='human', choices=list(PLAYER_TURNS),
+                        help="player White type")
+    parser.add_argument('blue', nargs='?', default='human', choices=list(PLAYER_TURNS),
+                        help="player Blue type")
+    parser.add_argument('undo', nargs='?', default='off', choices=['on', 'off'],
+                        help="enable undo/redo feature")
+    parser.add_argument('score', nargs='?', default='off', choices=['on', 'off'],
+                        help="enable score display")
+    parser.add_argument('--board-size', type=int, default=DEFAULT_SIZE, metavar='N',
+                        help=f"play on an NxN board (default: {DEFAULT_SIZE})")
+    parser.add_argument('--headless', type=int, metavar='N',
+                        help="play N games without a GUI and report the results")
+    parser.add_argument('--seed', type=int, help="random seed for headless games")
+    parser.add_argument('--tournament', nargs='+', metavar='TYPE', choices=[t for t in PLAYER_TURNS if t != 'human'],
+                        help="play a round robin between these AI player types")
+    parser.add_argument('--games', type=int, default=10, metavar='N',
+                        help="tournament games per pairing and color (default: 10)")
+    parser.add_argument('--results', default='tournament.jsonl', metavar='FILE',
+                        help="tournament results file, resumed if it exists (default: tournament.jsonl)")
+    parser.add_argument('--workers', type=int, metavar='N',
+                        help="tournament game processes (default: all cores)")
+    parser.add_argument('--time-budget', type=float, metavar='SECONDS',
+                        help="per-move thinking time for search players (default: 1.0)")
+    parser.add_argument('--max-depth', type=int, metavar='PLIES',
+                        help="depth limit for search players")
+    parser.add_argument('--table-size', type=int, default=1 << 16, metavar='ENTRIES',
+                        help="transposition table entries per search player (default: 65536)")
+    parser.add_argument('--iterations', type=int, metavar='N',
+                        help="playouts per move for mcts players")
+    parser.add_argument('--processes', type=int, metavar='N',
+                        help="playout processes for mcts players (default: all cores)")
+    parser.add_argument('--reuse-tree', action='store_true',
+                        help="let mcts players keep their search tree between turns")
+    parser.add_argument('--vectorized-playouts', action='store_true',
+                        help="let mcts players run each batch of playouts in lockstep with NumPy")
+    parser.add_argument('--no-book', dest='book', action='store_false',
+                        help="make AI players think through the opening instead of using the opening book")
+    parser.add_argument('--no-tactics', dest='tactics', action='store_false',
+                        help="skip the tactical pre-pass that takes and blocks immediate and forced wins")
+    parser.add_argument('--tactics-depth', type=int, metavar='MOVES',
+                        help="own moves the tactical pre-pass searches for a forced win (default: 2)")
+    parser.add_argument('--white-weights', type=weights_argument, metavar='WEIGHTS',
+                        help="heuristic weights of white: HEIGHT,CENTER,DISTANCE or a weights file from tune.py")
+    parser.add_argument('--blue-weights', type=weights_argument, metavar='WEIGHTS',
+                        help="heuristic weights of blue: HEIGHT,CENTER,DISTANCE or a weights file from tune.py")
+    parser.add_argument('--ai-delay', type=int, default=300, metavar='MS',
+                        help="pause before each AI move in the window (default: 300)")
+    parser.add_argument('--load', metavar='FILE',
+                        help="play on from a saved game; its player types and board size are used")
+    parser.add_argument('--autosave', metavar='FILE',
+                        help="save the game to FILE every round, so it can be resumed with --load")
+    parser.add_argument('--record', metavar='FILE',
+                        help="append every finished game to FILE in the binary game-record format")
+    parser.add_argument('--timings', metavar='FILE',
+                        help="append per-round phase timings to FILE as JSON lines and print a summary at exit")
+    parser.add_argument('--cprofile', metavar='DIR',
+                        help="write a cProfile dump of each game into DIR")
+    return parser.parse_args(argv)
+
+
+def player_settings(args, weights=None):
+    '''Returns the AI player settings given on the command line, with the player's heuristic weights'''
+    settings = {'table_size': args.table_size, 'reuse_tree': args.reuse_tree, 'book': args.book,
+                'tactics': args.tactics, 'vectorized_playouts': args.vectorized_playouts}
+    if weights is not None:
+        settings['weights'] = weights
+    for name in ('time_budget', 'max_depth', 'iterations', 'processes', 'tactics_depth'):
+        value = getattr(args, name)
+        if value is not None:
+            settings[name] = value
+    return settings
+
+
+def instrument_game(args, manager_class):
+    '''Turns on phase timing and profiling if asked for on the command line or in the environment'''
+    import instrument
+    if args.timings or args.cprofile:
+        instrument.enable(args.timings, args.cprofile, manager_class)
+    else:
+        instrument.enable_from_environment(manager_class)
+
+
+def record_writer(args):
+    '''Returns the writer of the game-record file given on the command line, or None'''
+    if args.record is None:
+        return None
+    from record import RecordWriter
+    return RecordWriter(args.record)
+
+
+def load_snapshot(args):
+    '''Returns the saved game given on the command line, or None. Its player types replace
+    those given as arguments'''
+    if args.load is None:
+        return None
+    import snapshot
+    try:
+        data = snapshot.read(args.load)
+        saved = snapshot.unpack(data)
+    except (OSError, ValueError) as error:
+        raise SystemExit(f"Cannot load {args.load}: {error}")
+    args.white, args.blue = saved.white_type, saved.blue_type
+    return data
+
+
+def run_headless(args):
+    '''Plays headless games and prints a summary of the results'''
+    from engine import GameEngine, play_games
+    instrument_game(args, GameEngine)
+    saved = load_snapshot(args)
+    try:
+        summary = play_games(args.white, args.blue, args.headless, args.seed,
+                             player_settings(args, args.white_weights), player_settings(args, args.blue_weights), args.board_size, record_writer(args),
+                             saved, args.autosave)
+    except ValueError as error:
+        raise SystemExit(str(error))
+    games = summary['games']
+    print(f"{games} games: {args.white} (white) vs {args.blue} (blue)")
+    print(f"white wins: {summary['white_wins']} ({summary['white_wins'] / games:.1%})")
+    print(f"blue wins: {summary['blue_wins']} ({summary['blue_wins'] / games:.1%})")
+    print(f"average turns: {summary['average_turns']:.1f}")
+    print(f"{summary['games_per_second']:.1f} games/s ({summary['seconds']:.2f}s)")
+    for color in ('white', 'blue'):
+        table = summary[f'{color}_table']
+        if table is not None:
+            print(f"{color} transposition table: {table['size']} entries, {table['hits'] + table['misses']} probes, "
+                  f"{table['hit_rate']:.1%} hits, {table['stores']} stores")
+
+
+def run_tournament(args):
+    '''Plays a round-robin tournament and prints the standings'''
+    import tournament
+    player_types = list(dict.fromkeys(args.tournament))
+    if len(player_types) < 2:
+        raise SystemExit("--tournament needs at least two different player types")
+    try:
+        results = tournament.run_tournament(player_types, args.games, args.results, args.seed or 0,
+                                            args.workers, player_settings(args),
+                                            progress=lambda result: print(
+                                                f"{result['id']}: {result['winner']} won in {result['turns']} turns"),
+                                            board_size=args.board_size)
+    except ValueError as error:
+        raise SystemExit(str(error))
+    print()
+    tournament.print_report(results, player_types)
+
 
 if __name__ == '__main__':
-    if len(sys.argv) < 1 or len(sys.argv) > 5:
-        print("Usage: python main.py [argv1] [argv2] [argv3] [argv4]")
-        sys.exit(1)
-
-    # Set default values
-    playerWhite = 'human'
-    playerBlue = 'human'
-    memento = False
-    score_display = False
-
-    # Parse command-line arguments
-    if len(sys.argv) >= 2:
-        if sys.argv[1] in ['human', 'random', 'heuristic']:
-            playerWhite = sys.argv[1]
-
-    if len(sys.argv) >= 3:
-        if sys.argv[2] in ['human', 'random', 'heuristic']:
-            playerBlue = sys.argv[2]
-
-    if len(sys.argv) >= 4:
-        if sys.argv[3] == 'on':
-            memento = True
-
-    if len(sys.argv) >= 5:
-        if sys.argv[4] == 'on':
-            score_display = True
-
-    # Run the game
-    SantoriniGUI(playerWhite, playerBlue, memento, score_display)
\ No newline at end of file
+    args = parse_args()
+    if not 4 <= args.board_size <= MAX_SIZE:
+        raise SystemExit(f"--board-size must be between 4 and {MAX_SIZE}")
+    if args.iterations is not None and args.iterations < 1:
+        raise SystemExit("--iterations needs at least one playout per move")
+
+    if args.tournament is not None:
+        run_tournament(args)
+    elif args.headless is not None:
+        if args.headless < 1:
+            raise SystemExit("--headless needs at least one game")
+        run_headless(args)
+    else:
+        # Run the game
+        from gui import SantoriniGUI
+        instrument_game(args, SantoriniGUI)
+        saved = load_snapshot(args)
+        if saved is not None and any(player_type not in PLAYER_TURNS for player_type in (args.white, args.blue)):
+            raise SystemExit(f"{args.load} has an unknown player type")
+        SantoriniGUI(args.white, args.blue, args.undo == 'on', args.score == 'on',
+                     player_settings(args, args.white_weights), player_settings(args, args.blue_weights), args.board_size, args.ai_delay,
+                     record_writer(args), saved, args.autosave)
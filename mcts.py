@@ -0,0 +1,193 @@
+import atexit
+import math
+import os
+import random
+import time
+from search import generate_actions, random_action, SIDE_WORKERS
+
+# UCT exploration constant
+EXPLORATION = math.sqrt(2)
+# Leaves per batch when playouts run in lockstep, where NumPy's overhead needs a wide batch
+VECTORIZED_BATCH = 64
+
+
+def playout(position, side, seed):
+    '''Plays random moves from the position, with the side to move first, until the game
+    ends. Returns the winning side. The position is modified'''
+    rng = random.Random(seed)
+    while True:
+        if position.won:
+            return 1 - side
+        action = random_action(position, side, rng)
+        if action is None:
+            return 1 - side
+        position.play(*action)
+        side = 1 - side
+
+
+def _playout_job(job):
+    # Runs in a pool worker; jobs carry a position snapshot so no tree state is shared. The
+    # position pickles without its board tables, which the worker looks up by board size
+    position, side, seed = job
+    return playout(position, side, seed)
+
+
+_pools = {}
+
+
+def get_pool(processes):
+    '''Returns a process pool of the given size, started on first use and reused afterwards'''
+    if processes not in _pools:
+        # Imported on first use, so games without parallel playouts start faster
+        import multiprocessing
+        _pools[processes] = multiprocessing.Pool(processes)
+    return _pools[processes]
+
+
+@atexit.register
+def _close_pools():
+    for pool in _pools.values():
+        pool.terminate()
+    _pools.clear()
+
+
+class Node:
+    '''A node of the search tree. wins counts playouts won by the side that moved into the node'''
+    __slots__ = ('action', 'parent', 'side', 'key', 'children', 'untried', 'visits', 'wins', 'winner')
+
+    def __init__(self, position, side, action=None, parent=None):
+        self.action = action
+        self.parent = parent
+        self.side = side
+        self.key = position.key(side)
+        self.children = []
+        self.visits = 0
+        self.wins = 0.0
+        # A finished game has a known winner and no moves to try
+        self.winner = None
+        if position.won:
+            self.winner = 1 - side
+            self.untried = []
+        else:
+            first, second = SIDE_WORKERS[side]
+            self.untried = generate_actions(position, side)
+            if not (position.reach[first] or position.reach[second]):
+                self.winner = 1 - side
+            random.shuffle(self.untried)
+
+    def select_child(self):
+        '''Returns the child with the highest UCT value'''
+        log_visits = math.log(self.visits)
+        return max(self.children, key=lambda child:
+                   child.wins / child.visits + EXPLORATION * math.sqrt(log_visits / child.visits))
+
+    def find(self, key):
+        '''Returns the descendant within two plies whose position has the given key, or None'''
+        for child in self.children:
+            if child.key == key:
+                return child
+            for grandchild in child.children:
+                if grandchild.key == key:
+                    return grandchild
+        return None
+
+
+class MonteCarloTreeSearch:
+    '''UCT tree search with random playouts. Each round selects a batch of leaves, using
+    virtual losses so the batch spreads across the tree, and runs their playouts on a process
+    pool, or in lockstep with NumPy if vectorized. Stops after the given number of iterations
+    or when the time budget runs out, though never before the root has a child to pick'''
+    def __init__(self, iterations=None, time_budget=None, processes=None, batch_size=None, vectorized=False):
+        if iterations is not None and iterations < 1:
+            raise ValueError(f"MCTS needs at least one iteration, got {iterations}")
+        self._iterations = iterations
+        self._time_budget = time_budget
+        self._processes = processes or os.cpu_count() or 1
+        self._vectorized = vectorized
+        self._batch_size = batch_size or (VECTORIZED_BATCH if vectorized else 4 * self._processes)
+        self.root = None
+        self.playouts = 0
+
+    def search(self, position, side, root=None):
+        '''Returns the most visited (worker index, move square, build square) action for the
+        side to move, or None if it has no legal action. root may be a node from an earlier
+        search to continue from, such as one returned by Node.find'''
+        # Selection plays moves on the position, so work on a copy of the caller's
+        position = position.copy()
+        if root is None or root.key != position.key(side):
+            root = Node(position, side)
+        root.parent = None
+        self.root = root
+        if not root.untried and not root.children:
+            return None
+
+        deadline = time.perf_counter() + self._time_budget if self._time_budget is not None else None
+        iterations = 0
+        self.playouts = 0
+        while True:
+            if self._iterations is not None and iterations >= self._iterations:
+                break
+            # A spent time budget still leaves the root a child to pick
+            if deadline is not None and root.children and time.perf_counter() >= deadline:
+                break
+            batch_size = self._batch_size
+            if self._iterations is not None:
+                batch_size = min(batch_size, self._iterations - iterations)
+            self._run_batch(position, root, batch_size)
+            iterations += batch_size
+
+        return max(root.children, key=lambda child: child.visits).action
+
+    def _run_batch(self, position, root, batch_size):
+        leaves = []
+        jobs = []
+        for _ in range(batch_size):
+            leaf, leaf_position = self._select_and_expand(position, root)
+            leaves.append(leaf)
+            if leaf_position is not None:
+                jobs.append((leaf_position, leaf.side, random.getrandbits(32)))
+
+        if self._vectorized and jobs:
+            # Imported here so NumPy is only needed when asked for
+            from simulate import playouts
+            results = iter(playouts([job[0] for job in jobs], [job[1] for job in jobs],
+                                    random.getrandbits(32)).tolist())
+        elif self._processes > 1 and len(jobs) > 1:
+            results = iter(get_pool(self._processes).map(_playout_job, jobs))
+        else:
+            results = iter([_playout_job(job) for job in jobs])
+        self.playouts += len(jobs)
+
+        for leaf in leaves:
+            winner = leaf.winner if leaf.winner is not None else next(results)
+            self._backpropagate(leaf, winner)
+
+    def _select_and_expand(self, position, root):
+        '''Walks down the tree by UCT and expands one child. Returns the leaf and a copy of its
+        position for a playout, or None as the position if the leaf's game is already over'''
+        node = root
+        path = []
+        # Virtual loss: count the visit now so other leaves of the batch look elsewhere
+        node.visits += 1
+        while not node.untried and node.children and node.winner is None:
+            node = node.select_child()
+            node.visits += 1
+            path.append((node.action, position.play(*node.action)))
+        if node.untried and node.winner is None:
+            action = node.untried.pop()
+            path.append((action, position.play(*action)))
+            child = Node(position, 1 - node.side, action, node)
+            node.children.append(child)
+            node = child
+            node.visits += 1
+        leaf_position = position.copy() if node.winner is None else None
+        # Unwind the walk so the caller's position is unchanged
+        for (index, _, build_sq), from_sq in reversed(path):
+            position.undo(index, from_sq, build_sq)
+        return node, leaf_position
+
+    def _backpropagate(self, node, winner):
+        while node is not None:
+            if winner != node.side:
+                node.wins += 1
+            node = node.parent
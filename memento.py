@@ -1,33 +1,72 @@
-import copy
+from array import array
+from bitboard import WORKER_NAMES, WORKER_INDEX
 
 class Memento:
-    '''Stores the santorini game state'''
-    # State is the board data
+    '''Stores one round of the santorini game as a delta: the worker that moved, the square it
+    moved from and to, and the square it built on. Packs into a single small integer'''
+    __slots__ = ('_state',)
+
     def __init__(self, state):
         self._state = state
 
-    def get_state(self):
-        '''Returns game state'''
+    @classmethod
+    def pack(cls, worker_name, from_sq, to_sq, build_sq):
+        '''Creates a memento from the parts of a round'''
+        return cls(WORKER_INDEX[worker_name] | from_sq << 2 | to_sq << 10 | build_sq << 18)
+
+    def encode(self):
+        '''Returns the packed integer form of the round'''
         return self._state
 
+    def get_state(self):
+        '''Returns the round as (worker name, from square, to square, build square)'''
+        state = self._state
+        return WORKER_NAMES[state & 3], state >> 2 & 0xFF, state >> 10 & 0xFF, state >> 18 & 0xFF
+
 
 class Originator:
-    '''Stores a state which can be changed.
-    Also saves states inside mementos and restores states from mementos'''
+    '''Records the move and build of the round in progress, saves finished rounds inside
+    mementos, and replays mementos forwards (redo) or backwards (undo) on the game state'''
     def __init__(self, state):
-        self._state = copy.deepcopy(state)
+        self.change_state(state)
 
     def change_state(self, state):
-        '''Changes the current state of the originator'''
-        self._state = copy.deepcopy(state)
+        '''Changes the game state the originator works on, dropping any unfinished round'''
+        self._state = state
+        self._move = None
+        self._build = None
+
+    def record_move(self, worker_name, old_row, old_col, row, col):
+        '''Records the move of the round in progress'''
+        geometry = self._state.get_board().get_geometry()
+        self._move = (worker_name, geometry.square(old_row, old_col), geometry.square(row, col))
+
+    def record_build(self, row, col):
+        '''Records the build of the round in progress'''
+        self._build = self._state.get_board().get_geometry().square(row, col)
 
     def save(self):
-        '''Creates an instance of a memento that stores self's state and returns the memento'''
-        return Memento(self._state)
+        '''Creates a memento of the recorded round and returns it'''
+        memento = Memento.pack(*self._move, self._build)
+        self._move = None
+        self._build = None
+        return memento
 
     def restore(self, memento):
-        '''Restores its state from a given memento'''
-        self._state = memento.get_state()
+        '''Undoes the memento's round: lowers the build, moves the worker back and rewinds the turn'''
+        worker_name, from_sq, to_sq, build_sq = memento.get_state()
+        coords = self._state.get_board().get_geometry().coords
+        self._state.unbuild(*coords(build_sq))
+        self._state.move_worker(self._state.get_worker(worker_name), *coords(from_sq))
+        self._state.decrement_turn_count()
+
+    def reapply(self, memento):
+        '''Redoes the memento's round: moves the worker, builds and advances the turn'''
+        worker_name, from_sq, to_sq, build_sq = memento.get_state()
+        coords = self._state.get_board().get_geometry().coords
+        self._state.move_worker(self._state.get_worker(worker_name), *coords(to_sq))
+        self._state.build(*coords(build_sq))
+        self._state.increment_turn_count()
 
     def get_state(self):
         '''Returns state'''
@@ -35,48 +74,41 @@ class Originator:
 
 
 class CareTaker:
-    '''Works with mementos via the originator'''
+    '''Works with mementos via the originator. History and undone rounds are kept as packed
+    integers in arrays, a few bytes per round'''
     def __init__(self, originator):
         self._originator = originator
-        self._history = []
-        self._undone = []
+        self._history = array('I')
+        self._undone = array('I')
 
     def do(self):
-        '''Creates a memento from the originator's current state and
+        '''Creates a memento of the originator's finished round and
         appends it to the history list'''
         memento = self._originator.save()
-        self._history.append(memento)
-
-    def do_redo(self):
-        '''Creates a memento from the originator's current state and
-        appends it to the undone list'''
-        memento = self._originator.save()
-        self._undone.append(memento)
+        self._history.append(memento.encode())
 
     def undo(self):
-        '''Returns the last memento in history and restores it in originator's state'''
-        memento = self._history.pop()
-        try:
-            self._originator.restore(memento)
-            return memento.get_state()
-        except Exception:
-            self.undo()
+        '''Pops the last round in history, reverts it in the originator's state and
+        returns the state'''
+        packed = self._history.pop()
+        self._originator.restore(Memento(packed))
+        self._undone.append(packed)
+        return self._originator.get_state()
 
     def redo(self):
-        '''Returns the last memento in history and restores it in originator's state'''
-        memento = self._undone.pop()
-        try:
-            self._originator.restore(memento)
-            return memento.get_state()
-        except Exception:
-            self.redo()
+        '''Pops the last undone round, replays it in the originator's state and
+        returns the state'''
+        packed = self._undone.pop()
+        self._originator.reapply(Memento(packed))
+        self._history.append(packed)
+        return self._originator.get_state()
 
     def history_isempty(self):
         '''Returns True if history list is empty'''
         if not len(self._history):
             return True
         return False
-        
+
     def undone_isempty(self):
         '''Returns True if undone list is empty'''
         if not len(self._undone):
@@ -85,4 +117,4 @@ class CareTaker:
 
     def clear_undone(self):
         '''Clears the list of undone. Do this when player chooses "next"'''
-        self._undone = []
\ No newline at end of file
+        self._undone = array('I')
@@ -1,5 +1,4 @@
 import abc
-import tkinter.messagebox
 
 class Subject:
     '''Subject class for the Observer pattern. Is inherited by the subject'''
@@ -35,6 +34,8 @@ class EndGameObserver(Observer):
         '''Responds to the game state
         If the game state is end, it will prompt to play again and either set restart as True or exit game'''
         if game_state == "end":
+            # Only a window has end-of-game observers, so Tk is not loaded before one is open
+            import tkinter.messagebox
             restart = tkinter.messagebox.askyesno(title=None, message=(f"{winner} has won!\nPlay again?"))
             if restart:
                 self._restart = True
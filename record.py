@@ -0,0 +1,193 @@
+import mmap
+import os
+import struct
+from bitboard import WORKER_NAMES, WORKER_INDEX
+from game import GameState
+from geometry import DIRECTION, get_geometry
+
+# A record file starts with the magic and format version, followed by one game after another
+MAGIC = b'SREC'
+VERSION = 1
+FILE_HEADER = struct.Struct('<4sB')
+# Each game: board size, winner, flags, seed, turn count, then the two player types as
+# length-prefixed ASCII strings, then one byte per turn
+GAME_HEADER = struct.Struct('<BBBqI')
+HAS_SEED = 1
+
+WINNERS = (None, 'white', 'blue')
+# Directions are stored as their index in DIRECTION, 3 bits each
+DIRECTIONS = tuple(DIRECTION)
+DIRECTION_INDEX = {dir: index for index, dir in enumerate(DIRECTIONS)}
+
+
+def encode_turn(worker_name, move_dir, build_dir):
+    '''Packs a turn into one byte: worker in the top 2 bits, then move and build direction'''
+    return WORKER_INDEX[worker_name] << 6 | DIRECTION_INDEX[move_dir] << 3 | DIRECTION_INDEX[build_dir]
+
+
+def decode_turn(turn):
+    '''Returns the (worker name, move direction, build direction) packed in a turn byte'''
+    return WORKER_NAMES[turn >> 6], DIRECTIONS[turn >> 3 & 7], DIRECTIONS[turn & 7]
+
+
+class GameRecorder:
+    '''Records the turns of one game as they are played, from the manager's move and build.
+    Like the Originator, it takes the move and build of a round separately and keeps undone
+    turns until the player plays on'''
+    def __init__(self, writer, white_type, blue_type, board_size, seed=None):
+        self._writer = writer
+        self._types = (white_type, blue_type)
+        self._geometry = get_geometry(board_size)
+        self._seed = seed
+        self._turns = bytearray()
+        self._undone = bytearray()
+        self._move = None
+
+    def record_move(self, worker_name, old_row, old_col, row, col):
+        '''Records the move of the turn in progress'''
+        self._move = (worker_name, self._geometry.direction_between[(self._geometry.square(old_row, old_col),
+                                                                     self._geometry.square(row, col))], row, col)
+
+    def record_build(self, row, col):
+        '''Completes the turn in progress with its build'''
+        worker_name, move_dir, move_row, move_col = self._move
+        build_dir = self._geometry.direction_between[(self._geometry.square(move_row, move_col),
+                                                      self._geometry.square(row, col))]
+        self._turns.append(encode_turn(worker_name, move_dir, build_dir))
+        self._move = None
+
+    def undo(self):
+        '''Takes back the last turn, keeping it in case it is redone'''
+        self._undone.append(self._turns.pop())
+
+    def redo(self):
+        '''Replays the last undone turn'''
+        self._turns.append(self._undone.pop())
+
+    def clear_undone(self):
+        '''Forgets the undone turns once the player plays on'''
+        self._undone.clear()
+
+    def finish(self, winner):
+        '''Writes the finished game to the record file'''
+        self._writer.write_game(self._types, self._geometry.size, winner, self._seed, self._turns)
+
+
+class RecordWriter:
+    '''Appends games to a record file, writing the file header if the file is new'''
+    def __init__(self, path):
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(FILE_HEADER.pack(MAGIC, VERSION))
+
+    def new_game(self, white_type, blue_type, board_size, seed=None):
+        '''Returns a recorder for a game that is about to start'''
+        return GameRecorder(self, white_type, blue_type, board_size, seed)
+
+    def write_game(self, player_types, board_size, winner, seed, turns):
+        '''Appends one game to the file'''
+        flags = HAS_SEED if seed is not None else 0
+        data = bytearray(GAME_HEADER.pack(board_size, WINNERS.index(winner), flags, seed or 0, len(turns)))
+        for player_type in player_types:
+            name = player_type.encode('ascii')
+            data.append(len(name))
+            data += name
+        data += turns
+        self._file.write(data)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class GameRecord:
+    '''One game read from a record file. The turns stay packed until they are iterated'''
+    def __init__(self, white_type, blue_type, board_size, winner, seed, turns):
+        self.white_type = white_type
+        self.blue_type = blue_type
+        self.board_size = board_size
+        self.winner = winner
+        self.seed = seed
+        self.turns = turns
+
+    def __len__(self):
+        return len(self.turns)
+
+    def moves(self):
+        '''Yields each turn as (worker name, move direction, build direction)'''
+        for turn in self.turns:
+            yield decode_turn(turn)
+
+    def states(self):
+        '''Replays the game, yielding the game state before the first turn and after every turn.
+        The same GameState is updated in place, so copy what you need before moving on'''
+        state = GameState(self.white_type, self.blue_type, False, False, board_size=self.board_size)
+        step = state.get_board().get_geometry().step
+        yield state
+        for worker_name, move_dir, build_dir in self.moves():
+            worker = state.get_worker(worker_name)
+            move_x, move_y = step[(worker.x, worker.y)][move_dir]
+            build_x, build_y = step[(move_x, move_y)][build_dir]
+            state.move_worker(worker, move_x, move_y)
+            state.build(build_x, build_y)
+            state.increment_turn_count()
+            yield state
+
+
+class RecordReader:
+    '''Reads a record file through a memory map, so a file of millions of games is scanned
+    one game at a time instead of being loaded'''
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < FILE_HEADER.size:
+            raise ValueError(f"{path} is not a game record file")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = FILE_HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a game record file")
+        if version != VERSION:
+            raise ValueError(f"{path} has record format version {version}, expected {VERSION}")
+
+    def __iter__(self):
+        '''Yields the games in the file in order'''
+        data = self._map
+        offset = FILE_HEADER.size
+        while offset + GAME_HEADER.size <= len(data):
+            board_size, winner, flags, seed, turn_count = GAME_HEADER.unpack_from(data, offset)
+            offset += GAME_HEADER.size
+            player_types = []
+            for _ in range(2):
+                # A game cut short by an interrupted write ends the file
+                if offset >= len(data) or offset + 1 + data[offset] > len(data):
+                    return
+                length = data[offset]
+                player_types.append(data[offset + 1:offset + 1 + length].decode('ascii'))
+                offset += 1 + length
+            if offset + turn_count > len(data):
+                return
+            turns = data[offset:offset + turn_count]
+            offset += turn_count
+            yield GameRecord(*player_types, board_size, WINNERS[winner], seed if flags & HAS_SEED else None, turns)
+
+    def positions(self):
+        '''Yields (game, state) for every position of every game, replaying lazily'''
+        for game in self:
+            for state in game.states():
+                yield game, state
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
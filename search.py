@@ -0,0 +1,221 @@
+import random
+import time
+from bitboard import iter_bits
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
+
+WIN_SCORE = 100000
+# Scores this close to WIN_SCORE are wins a number of plies away
+WIN_THRESHOLD = WIN_SCORE - 1000
+HEIGHT_WEIGHT, CENTER_WEIGHT, DISTANCE_WEIGHT = 3, 2, 1
+
+# Worker indices of each side; white (side 0) has A and B, blue (side 1) has Y and Z
+SIDE_WORKERS = ((0, 1), (2, 3))
+
+
+def _score_to_table(score, ply):
+    # Store win scores relative to the node, so they stay valid wherever the position recurs
+    if score >= WIN_THRESHOLD:
+        return score + ply
+    if score <= -WIN_THRESHOLD:
+        return score - ply
+    return score
+
+
+def _score_from_table(score, ply):
+    if score >= WIN_THRESHOLD:
+        return score - ply
+    if score <= -WIN_THRESHOLD:
+        return score + ply
+    return score
+
+
+class SearchTimeout(Exception):
+    '''Raised inside the search when the time budget has run out'''
+
+
+def side_of(player):
+    '''Returns the side index (0 for white, 1 for blue) of the given player'''
+    return 0 if player.color == 'white' else 1
+
+
+def generate_actions(position, side):
+    '''Returns every legal (worker index, move square, build square) action for the side'''
+    actions = []
+    for index in SIDE_WORKERS[side]:
+        for move_sq, build_mask in position.generate_moves(index):
+            for build_sq in iter_bits(build_mask):
+                actions.append((index, move_sq, build_sq))
+    return actions
+
+
+def random_action(position, side, rng=random):
+    '''Picks an action the way RandomTurn does: a random worker, falling back to the other one
+    if it cannot move, then a random move and a random build. Returns None if neither worker
+    can move'''
+    first, second = SIDE_WORKERS[side]
+    index = rng.choice((first, second))
+    moves = position.generate_moves(index)
+    if not moves:
+        index = second if index == first else first
+        moves = position.generate_moves(index)
+        if not moves:
+            return None
+    move_sq, build_mask = rng.choice(moves)
+    build_sq = rng.choice(list(iter_bits(build_mask)))
+    return (index, move_sq, build_sq)
+
+
+def evaluate_side(position, side):
+    '''Scores the side's workers with HeuristicTurn's height, center and distance terms'''
+    workers = position.workers
+    first, second = SIDE_WORKERS[side]
+    first_sq, second_sq = workers[first], workers[second]
+    opponent_first, opponent_second = (workers[index] for index in SIDE_WORKERS[1 - side])
+    height_score = position.height(first_sq) + position.height(second_sq)
+    geometry = position.geometry
+    ring = geometry.ring
+    center_score = ring[first_sq] + ring[second_sq]
+    first_distance, second_distance = geometry.distance[first_sq], geometry.distance[second_sq]
+    distance_score = geometry.max_distance_score \
+        - (min(first_distance[opponent_first], second_distance[opponent_first])
+           + min(first_distance[opponent_second], second_distance[opponent_second]))
+    return HEIGHT_WEIGHT * height_score + CENTER_WEIGHT * center_score + DISTANCE_WEIGHT * distance_score
+
+
+def evaluate(position, side):
+    '''Returns the static score of the position from the side's point of view'''
+    return evaluate_side(position, side) - evaluate_side(position, 1 - side)
+
+
+class AlphaBetaSearch:
+    '''Negamax search with alpha-beta pruning and iterative deepening.
+    Deepens one ply at a time until the time budget runs out, and returns the best action
+    of the deepest search that finished. Results are cached in a transposition table, which
+    can be shared between searches to carry knowledge from one move to the next'''
+    def __init__(self, time_budget, max_depth=None, table=None):
+        self._time_budget = time_budget
+        self._max_depth = max_depth or 64
+        self.table = table if table is not None else TranspositionTable()
+        self._deadline = None
+        self._killers = {}
+        self.nodes = 0
+        self.depth = 0
+
+    def search(self, position, side):
+        '''Returns the best (worker index, move square, build square) action for the side to
+        move, or None if it has no legal action. The search runs on a copy of the position, so
+        a timeout can abandon it halfway through a line'''
+        position = position.copy()
+        self._deadline = time.perf_counter() + self._time_budget
+        self._killers = {}
+        self.nodes = 0
+        self.table.new_search()
+        actions = self._order(position, generate_actions(position, side), 0)
+        if not actions:
+            return None
+        best_action = actions[0]
+        # A move onto height 3 wins on the spot, no search needed
+        if position.height(best_action[1]) == 3:
+            return best_action
+
+        for depth in range(1, self._max_depth + 1):
+            try:
+                scores = self._search_root(position, side, actions, depth)
+            except SearchTimeout:
+                break
+            # Search the best actions of this iteration first in the next one
+            actions.sort(key=lambda action: scores[action], reverse=True)
+            best_action = actions[0]
+            self.depth = depth
+            if abs(scores[best_action]) >= WIN_THRESHOLD:
+                break
+        return best_action
+
+    def _search_root(self, position, side, actions, depth):
+        scores = {}
+        alpha = -WIN_SCORE - 1
+        for action in actions:
+            index, move_sq, build_sq = action
+            from_sq = position.play(index, move_sq, build_sq)
+            score = -self._negamax(position, 1 - side, depth - 1, -WIN_SCORE - 1, -alpha, 1)
+            position.undo(index, from_sq, build_sq)
+            scores[action] = score
+            if score > alpha:
+                alpha = score
+        return scores
+
+    def _negamax(self, position, side, depth, alpha, beta, ply):
+        self.nodes += 1
+        if not self.nodes & 1023 and time.perf_counter() > self._deadline:
+            raise SearchTimeout()
+
+        # The previous mover stepped onto height 3
+        if position.won:
+            return -WIN_SCORE + ply
+        first, second = SIDE_WORKERS[side]
+        if not (position.reach[first] or position.reach[second]):
+            return -WIN_SCORE + ply
+        # Any reachable height 3 square is a win for the side to move
+        three = position.levels[2] & ~position.levels[3]
+        for index in (first, second):
+            if position.reach[index] & three:
+                return WIN_SCORE - ply
+        if depth == 0:
+            return evaluate(position, side)
+
+        key = position.key(side)
+        entry = self.table.lookup(key)
+        table_move = None
+        if entry is not None:
+            entry_depth, entry_score, bound, table_move = entry
+            if entry_depth >= depth:
+                entry_score = _score_from_table(entry_score, ply)
+                if bound == EXACT:
+                    return entry_score
+                if bound == LOWER and entry_score >= beta:
+                    return entry_score
+                if bound == UPPER and entry_score <= alpha:
+                    return entry_score
+
+        original_alpha = alpha
+        best_score = -WIN_SCORE - 1
+        best_action = None
+        for action in self._order(position, generate_actions(position, side), ply, table_move):
+            index, move_sq, build_sq = action
+            from_sq = position.play(index, move_sq, build_sq)
+            score = -self._negamax(position, 1 - side, depth - 1, -beta, -alpha, ply + 1)
+            position.undo(index, from_sq, build_sq)
+            if score > best_score:
+                best_score = score
+                best_action = action
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        self._store_killer(action, ply)
+                        break
+
+        if best_score <= original_alpha:
+            bound = UPPER
+        elif best_score >= beta:
+            bound = LOWER
+        else:
+            bound = EXACT
+        self.table.store(key, depth, _score_to_table(best_score, ply), bound, best_action)
+        return best_score
+
+    def _order(self, position, actions, ply, table_move=None):
+        '''Orders actions so the likeliest best ones are searched first: the transposition
+        table's best move, killer moves, then climbing moves, then builds that do not cap a
+        tower with a dome'''
+        killers = self._killers.get(ply, ())
+        height = position.height
+
+        def key(action):
+            _, move_sq, build_sq = action
+            return (action == table_move, action in killers, height(move_sq), height(build_sq) < 3)
+        return sorted(actions, key=key, reverse=True)
+
+    def _store_killer(self, action, ply):
+        killers = self._killers.get(ply, ())
+        if action not in killers:
+            self._killers[ply] = (action,) + killers[:1]
@@ -0,0 +1,369 @@
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from engine import GameEngine
+from geometry import DEFAULT_SIZE, MAX_SIZE
+from turn import PLAYER_TURNS
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 7878
+DEFAULT_MAX_GAMES = 1000
+# Messages waiting for a connection that reads too slowly; past this its subscriptions are dropped
+MAX_QUEUED = 1000
+# Settings a client may give an AI player
+PLAYER_SETTINGS = ('time_budget', 'max_depth', 'table_size', 'iterations', 'processes', 'reuse_tree',
+                   'book', 'tactics', 'tactics_depth', 'weights', 'vectorized_playouts')
+# Settings checked by type, since a bad value would otherwise only fail the AI turn
+COUNT_SETTINGS = ('max_depth', 'table_size', 'iterations', 'processes', 'tactics_depth')
+FLAG_SETTINGS = ('reuse_tree', 'book', 'tactics', 'vectorized_playouts')
+
+
+class GameSession(GameEngine):
+    '''One game hosted by the server. Human players' turns are submitted through play, AI turns
+    decide on the server's executor and play on the event loop, and every turn and the end of
+    the game are sent to the connections subscribed to it'''
+    ALLOW_HUMANS = True
+
+    def __init__(self, game_id, playerWhite_type, playerBlue_type, playerWhite_settings=None,
+                 playerBlue_settings=None, board_size=DEFAULT_SIZE, record=None):
+        super().__init__(playerWhite_type, playerBlue_type, playerWhite_settings, playerBlue_settings,
+                         board_size, record)
+        self.game_id = game_id
+        self._subscribers = set()
+        # (worker name, move direction, row, col) of the turn in progress
+        self._last_move = None
+        self._ended = False
+        self._closed = False
+        self._ai_task = None
+
+    def subscribe(self, queue):
+        '''Sends the game's events to a connection's outgoing queue'''
+        self._subscribers.add(queue)
+
+    def unsubscribe(self, queue):
+        '''Stops sending the game's events to a connection'''
+        self._subscribers.discard(queue)
+
+    def get_state(self):
+        '''Returns the game as a JSON-serializable dict'''
+        game = self._game
+        board = game.get_board()
+        size = board.get_size()
+        return {
+            'game': self.game_id,
+            'board_size': size,
+            'heights': [[board.get_specific_cell(x, y).get_height() for y in range(size)] for x in range(size)],
+            'workers': {worker.name: [worker.x, worker.y]
+                        for player in game.get_players() for worker in player.get_workers()},
+            'turn': game.get_turncount(),
+            'to_move': self._player.color,
+            'players': {'white': game.get_white().type, 'blue': game.get_blue().type},
+            'winner': self._winner,
+            # What the player to move can do: {worker: {move direction: [build directions]}}
+            'moves': {} if self._winner is not None else
+            {worker.name: worker.enumerate_moves(board) for worker in self._player.get_workers()},
+        }
+
+    def is_finished(self):
+        '''Returns True once the game has a winner'''
+        return self._winner is not None
+
+    def play(self, worker_name, move_dir, build_dir):
+        '''Plays a human player's turn given as a worker name and move and build directions.
+        Raises ValueError if it is not a human's turn or the turn is not legal'''
+        if self._winner is not None:
+            raise ValueError("The game is over")
+        if self._player.type != 'human':
+            raise ValueError(f"It is {self._player.color}'s turn, played by the {self._player.type} AI")
+        if not self._player.check_valid_worker(worker_name):
+            raise ValueError(f"'{worker_name}' is not one of {self._player.color}'s workers")
+        board = self._game.get_board()
+        worker = self._player.select_worker(worker_name)
+        moves = worker.enumerate_moves(board)
+        if move_dir not in moves:
+            raise ValueError(f"{worker_name} cannot move '{move_dir}'")
+        if build_dir not in moves[move_dir]:
+            raise ValueError(f"{worker_name} cannot build '{build_dir}' after moving '{move_dir}'")
+        step = board.get_geometry().step
+        move_x, move_y = step[(worker.x, worker.y)][move_dir]
+        build_x, build_y = step[(move_x, move_y)][build_dir]
+        self.move(move_x, move_y, worker.x, worker.y, worker)
+        self.build(build_x, build_y)
+
+    def start_ai_turns(self, executor):
+        '''Starts playing AI turns in the background, unless they are already being played'''
+        if self._ai_task is None or self._ai_task.done():
+            self._ai_task = asyncio.ensure_future(self._play_ai_turns(executor))
+            self._ai_task.add_done_callback(self._ai_turns_done)
+
+    # Plays AI turns until the game ends or a human is to move. Deciding runs on the executor,
+    # so a slow search never holds up the event loop or the other games
+    async def _play_ai_turns(self, executor):
+        loop = asyncio.get_running_loop()
+        while self._winner is None and self._player.type != 'human' and not self._closed:
+            turn = PLAYER_TURNS[self._player.type](self._game.get_board(), self._player, self)
+            decision = await loop.run_in_executor(executor, turn.decide)
+            if self._closed:
+                return
+            turn.play(decision)
+
+    def _ai_turns_done(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            error = task.exception()
+            print(f"Game {self.game_id}: AI turn failed: {error!r}", file=sys.stderr)
+            self._publish({'event': 'error', 'game': self.game_id, 'error': str(error)})
+
+    def close(self):
+        '''Stops the game; an AI decision still being made is dropped'''
+        self._closed = True
+        self._subscribers.clear()
+
+    def move(self, row, col, old_row, old_col, worker):
+        '''Move specified worker to a new cell'''
+        geometry = self._game.get_board().get_geometry()
+        move_dir = geometry.direction_between[(geometry.square(old_row, old_col), geometry.square(row, col))]
+        self._last_move = (worker.name, move_dir, row, col)
+        super().move(row, col, old_row, old_col, worker)
+
+    def build(self, row, col):
+        '''Build in the specified cell, advance to the next round and send the turn to subscribers'''
+        worker_name, move_dir, move_row, move_col = self._last_move
+        geometry = self._game.get_board().get_geometry()
+        build_dir = geometry.direction_between[(geometry.square(move_row, move_col), geometry.square(row, col))]
+        color = self._player.color
+        super().build(row, col)
+        self._last_move = None
+        self._publish({'event': 'turn', 'game': self.game_id, 'player': color, 'worker': worker_name,
+                       'move': move_dir, 'build': build_dir, 'state': self.get_state()})
+        self._announce_end()
+
+    def check_game_end(self, player, othercondition=False):
+        '''Records the winner if the game has ended with the given player to move'''
+        super().check_game_end(player, othercondition)
+        # A game ended by a build is announced after its turn
+        if self._last_move is None:
+            self._announce_end()
+
+    def _announce_end(self):
+        if self._winner is not None and not self._ended:
+            self._ended = True
+            self._publish({'event': 'end', 'game': self.game_id, 'winner': self._winner})
+
+    def _publish(self, event):
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # A connection this far behind has stopped reading
+                self._subscribers.discard(queue)
+
+
+class GameServer:
+    '''Hosts many game sessions in one process for clients that send one JSON request per
+    line and receive one JSON response per line, with the events of the games they subscribe
+    to interleaved. Requests have an 'op' and may carry an 'id' that is echoed back:
+    create, play, state, subscribe, unsubscribe and close'''
+    def __init__(self, executor, max_games=DEFAULT_MAX_GAMES, record=None):
+        self._executor = executor
+        self._max_games = max_games
+        self._record = record
+        self._sessions = {}
+        self._ids = itertools.count(1)
+        # The writer of every open connection, by the task serving it
+        self._connections = {}
+
+    async def handle_connection(self, reader, writer):
+        '''Serves one client connection until it closes'''
+        self._connections[asyncio.current_task()] = writer
+        queue = asyncio.Queue(MAX_QUEUED)
+        sender = asyncio.ensure_future(self._send(queue, writer))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    await queue.put(self.handle_request(line, queue))
+        except (ConnectionError, ValueError):
+            # ValueError is a line longer than the stream limit
+            pass
+        finally:
+            for session in self._sessions.values():
+                session.unsubscribe(queue)
+            sender.cancel()
+            writer.close()
+            del self._connections[asyncio.current_task()]
+
+    async def close(self):
+        '''Stops every game and closes every connection, waiting for the connections to finish'''
+        for session in self._sessions.values():
+            session.close()
+        tasks = list(self._connections)
+        for writer in self._connections.values():
+            writer.close()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _send(self, queue, writer):
+        while True:
+            message = await queue.get()
+            writer.write((json.dumps(message) + '\n').encode())
+            await writer.drain()
+
+    def handle_request(self, line, queue):
+        '''Handles one request line from a connection and returns the response'''
+        request = {}
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("Requests must be JSON objects")
+            handler = getattr(self, f"_op_{request.get('op')}", None)
+            if handler is None:
+                raise ValueError(f"Unknown op {request.get('op')!r}")
+            response = dict(handler(request, queue), ok=True)
+        except (ValueError, TypeError) as error:
+            response = {'ok': False, 'error': str(error)}
+        if 'id' in request:
+            response['id'] = request['id']
+        return response
+
+    def _session(self, request):
+        game_id = _field(request, 'game')
+        if game_id not in self._sessions:
+            raise ValueError(f"No game {game_id!r}")
+        return self._sessions[game_id]
+
+    def _op_create(self, request, queue):
+        # Make room by dropping finished games, oldest first
+        for game_id, session in list(self._sessions.items()):
+            if len(self._sessions) < self._max_games:
+                break
+            if session.is_finished():
+                del self._sessions[game_id]
+        if len(self._sessions) >= self._max_games:
+            raise ValueError(f"The server is hosting its limit of {self._max_games} games")
+        board_size = request.get('board_size', DEFAULT_SIZE)
+        if not isinstance(board_size, int) or not 4 <= board_size <= MAX_SIZE:
+            raise ValueError(f"board_size must be between 4 and {MAX_SIZE}")
+        for color in ('white', 'blue'):
+            if request.get(color, 'human') not in PLAYER_TURNS:
+                raise ValueError(f"Unknown {color} player type {request.get(color)!r}; "
+                                 f"expected one of {', '.join(PLAYER_TURNS)}")
+        game_id = str(next(self._ids))
+        session = GameSession(game_id, request.get('white', 'human'), request.get('blue', 'human'),
+                              _player_settings(request.get('white_settings')),
+                              _player_settings(request.get('blue_settings')), board_size, self._record)
+        self._sessions[game_id] = session
+        # Subscribed before any AI turn is played, so no event is missed
+        if request.get('subscribe', True):
+            session.subscribe(queue)
+        session.start_ai_turns(self._executor)
+        return {'game': game_id, 'state': session.get_state()}
+
+    def _op_play(self, request, queue):
+        session = self._session(request)
+        session.play(_field(request, 'worker'), _field(request, 'move'), _field(request, 'build'))
+        session.start_ai_turns(self._executor)
+        return {'state': session.get_state()}
+
+    def _op_state(self, request, queue):
+        return {'state': self._session(request).get_state()}
+
+    def _op_subscribe(self, request, queue):
+        session = self._session(request)
+        session.subscribe(queue)
+        return {'state': session.get_state()}
+
+    def _op_unsubscribe(self, request, queue):
+        self._session(request).unsubscribe(queue)
+        return {}
+
+    def _op_close(self, request, queue):
+        session = self._session(request)
+        session.close()
+        del self._sessions[session.game_id]
+        return {}
+
+
+def _field(request, name):
+    # A required request field, reported as a protocol error when missing
+    if name not in request:
+        raise ValueError(f"Missing {name!r}")
+    return request[name]
+
+
+def _player_settings(settings):
+    # AI player settings from a create request. Search players run their playouts in the
+    # server process unless asked otherwise, as in tournaments
+    if settings is None:
+        settings = {}
+    if not isinstance(settings, dict):
+        raise ValueError("Player settings must be a JSON object")
+    unknown = set(settings) - set(PLAYER_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown player settings: {', '.join(sorted(unknown))}")
+    for name in COUNT_SETTINGS:
+        if name in settings and (not _is_number(settings[name]) or isinstance(settings[name], float)
+                                 or settings[name] < 1):
+            raise ValueError(f"{name} must be a positive integer")
+    if 'time_budget' in settings and (not _is_number(settings['time_budget']) or settings['time_budget'] <= 0):
+        raise ValueError("time_budget must be a positive number of seconds")
+    for name in FLAG_SETTINGS:
+        if name in settings and not isinstance(settings[name], bool):
+            raise ValueError(f"{name} must be true or false")
+    if 'weights' in settings and (not isinstance(settings['weights'], list) or len(settings['weights']) != 3
+                                  or not all(_is_number(weight) for weight in settings['weights'])):
+        raise ValueError("weights must be a list of three numbers")
+    settings = dict(settings)
+    settings.setdefault('processes', 1)
+    if 'weights' in settings:
+        settings['weights'] = tuple(settings['weights'])
+    return settings
+
+
+def _is_number(value):
+    # JSON true and false load as bools, which Python also counts as ints, and JSON allows
+    # NaN and Infinity
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None, threads=None,
+                max_games=DEFAULT_MAX_GAMES, record=None):
+    '''Runs the game server on a TCP port, or on a Unix socket if unix_path is given, until cancelled'''
+    with ThreadPoolExecutor(threads) as executor:
+        server = GameServer(executor, max_games, record)
+        if unix_path is not None:
+            listener = await asyncio.start_unix_server(server.handle_connection, unix_path)
+        else:
+            listener = await asyncio.start_server(server.handle_connection, host, port)
+        try:
+            async with listener:
+                await listener.serve_forever()
+        finally:
+            # Let open connections see their end instead of being cancelled mid-read
+            await server.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Host many Santorini games for clients over line-delimited JSON")
+    parser.add_argument('--host', default=DEFAULT_HOST, help=f"address to listen on (default: {DEFAULT_HOST})")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"TCP port (default: {DEFAULT_PORT})")
+    parser.add_argument('--unix', metavar='PATH', help="listen on a Unix socket instead of TCP")
+    parser.add_argument('--threads', type=int, metavar='N', help="threads deciding AI turns (default: Python's default)")
+    parser.add_argument('--max-games', type=int, default=DEFAULT_MAX_GAMES, metavar='N',
+                        help=f"games hosted at once (default: {DEFAULT_MAX_GAMES})")
+    parser.add_argument('--record', metavar='FILE', help="append every finished game to a game-record file")
+    args = parser.parse_args()
+
+    record = None
+    if args.record is not None:
+        from record import RecordWriter
+        record = RecordWriter(args.record)
+    print(f"Serving on {args.unix or f'{args.host}:{args.port}'}", flush=True)
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.threads, args.max_games, record))
+    except KeyboardInterrupt:
+        pass
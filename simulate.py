@@ -0,0 +1,193 @@
+import argparse
+import time
+import numpy
+from book import start_position
+from geometry import DEFAULT_SIZE
+
+# Games played side by side; large enough that NumPy's per-call overhead is spread thin
+DEFAULT_BATCH = 10000
+# Height given to the padding square that pads neighbor lists, so it is never a target
+PAD_HEIGHT = 4
+
+
+def _neighbor_table(geometry):
+    # (squares + 1, 8) array of each square's neighbors, padded with the extra square index
+    # squares; the padding square's own row is padding too
+    pad = geometry.squares
+    table = numpy.full((pad + 1, 8), pad, dtype=numpy.int64)
+    for sq, entries in enumerate(geometry.neighbor_dirs):
+        table[sq, :len(entries)] = [neighbor for _, neighbor, _ in entries]
+    return table
+
+
+def position_rows(position):
+    '''Returns a bitboard position as a row of heights, padding square included, and a row of
+    worker squares'''
+    squares = position.geometry.squares
+    heights = [position.height(sq) for sq in range(squares)] + [PAD_HEIGHT]
+    return heights, list(position.workers)
+
+
+class LockstepGames:
+    '''Random games played in lockstep as rows of NumPy arrays: heights, worker squares, side
+    to move and plays so far. Each step plays one turn of every game at once, the way
+    RandomTurn does: a random worker, the other one if it cannot move, then a random move and
+    a random build. Games that end are retired from the arrays and new ones can be added'''
+    def __init__(self, geometry, rng):
+        self._neighbors = _neighbor_table(geometry)
+        self._rng = rng
+        self.heights = numpy.zeros((0, geometry.squares + 1), dtype=numpy.int8)
+        self.workers = numpy.zeros((0, 4), dtype=numpy.int64)
+        self.sides = numpy.zeros(0, dtype=numpy.int8)
+        self.plays = numpy.zeros(0, dtype=numpy.int32)
+        self.ids = numpy.zeros(0, dtype=numpy.int64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, heights, workers, sides, ids):
+        '''Adds games as rows: heights (with the padding square), worker squares, side to move
+        and an id by which their results are reported'''
+        self.heights = numpy.concatenate((self.heights, numpy.asarray(heights, dtype=numpy.int8)))
+        self.workers = numpy.concatenate((self.workers, numpy.asarray(workers, dtype=numpy.int64)))
+        self.sides = numpy.concatenate((self.sides, numpy.asarray(sides, dtype=numpy.int8)))
+        self.plays = numpy.concatenate((self.plays, numpy.zeros(len(ids), dtype=numpy.int32)))
+        self.ids = numpy.concatenate((self.ids, numpy.asarray(ids, dtype=numpy.int64)))
+
+    def step(self):
+        '''Plays one turn of every game. Returns (ids, winning sides, plays) of the games that
+        ended, which are retired'''
+        rng = self._rng
+        heights, workers, sides = self.heights, self.workers, self.sides
+        count = len(sides)
+        rows = numpy.arange(count)
+        # Squares are read through flat indices row * width + square, which NumPy gathers
+        # much faster than two-dimensional fancy indexing
+        base = rows * heights.shape[1]
+        flat_heights = heights.reshape(-1)
+        occupied = numpy.zeros(heights.size, dtype=bool)
+        occupied[base[:, None] + workers] = True
+
+        # Move targets of both workers of the side to move: (games, 2, 8)
+        side_workers = workers[rows[:, None], 2 * sides[:, None] + numpy.arange(2)]
+        neighbors = self._neighbors[side_workers]
+        flat_neighbors = base[:, None, None] + neighbors
+        neighbor_heights = flat_heights.take(flat_neighbors)
+        worker_heights = flat_heights.take(base[:, None] + side_workers)
+        movable = (neighbor_heights <= worker_heights[:, :, None] + 1) & (neighbor_heights < PAD_HEIGHT) \
+            & ~occupied.take(flat_neighbors)
+        can_move = movable.any(axis=2)
+        # The side to move loses when neither worker can move
+        stuck = ~can_move.any(axis=1)
+
+        # A random worker, the other one if it cannot move
+        pick = rng.integers(0, 2, count)
+        pick = numpy.where(can_move[rows, pick], pick, 1 - pick)
+        # A random legal move and build: the largest of random keys over the legal entries
+        targets = movable[rows, pick]
+        choice = numpy.where(targets, rng.random(targets.shape), -1.0).argmax(axis=1)
+        from_sq = side_workers[rows, pick]
+        move_sq = neighbors[rows, pick, choice]
+        # Rows that are stuck picked a move anyway, which must not count as a win
+        won = (flat_heights.take(base + move_sq) == 3) & ~stuck
+        build_neighbors = self._neighbors[move_sq]
+        flat_build_neighbors = base[:, None] + build_neighbors
+        # The square just left counts as free
+        buildable = (flat_heights.take(flat_build_neighbors) < PAD_HEIGHT) \
+            & (~occupied.take(flat_build_neighbors) | (build_neighbors == from_sq[:, None]))
+        build_sq = build_neighbors[rows, numpy.where(buildable, rng.random(buildable.shape), -1.0).argmax(axis=1)]
+
+        live = rows[~stuck]
+        workers[live, 2 * sides[live] + pick[live]] = move_sq[live]
+        flat_heights[base[live] + build_sq[live]] += 1
+        self.plays[live] += 1
+
+        # Moving onto height 3 wins for the mover; being stuck loses for the side to move
+        finished = stuck | won
+        winners = numpy.where(won, sides, 1 - sides)[finished]
+        results = (self.ids[finished], winners, self.plays[finished])
+        self.sides = sides ^ 1
+        if finished.any():
+            keep = ~finished
+            self.heights = heights[keep]
+            self.workers = workers[keep]
+            self.sides = self.sides[keep]
+            self.plays = self.plays[keep]
+            self.ids = self.ids[keep]
+        return results
+
+
+def simulate(games, board_size=DEFAULT_SIZE, batch_size=DEFAULT_BATCH, seed=None, position=None, side=0):
+    '''Plays random-vs-random games, batch_size at a time, from the start position or the given
+    bitboard position with side to move. Returns arrays of each game's winning side (0 white,
+    1 blue) and turn count, counted as GameEngine does'''
+    if position is None:
+        position = start_position(board_size)
+    heights, workers = position_rows(position)
+    lockstep = LockstepGames(position.geometry, numpy.random.default_rng(seed))
+    winners = numpy.zeros(games, dtype=numpy.int8)
+    turns = numpy.zeros(games, dtype=numpy.int32)
+    started = 0
+    while started < games or len(lockstep):
+        # Keep the batch full while games are left to start
+        count = min(batch_size - len(lockstep), games - started)
+        if count > 0:
+            lockstep.add([heights] * count, [workers] * count, [side] * count, range(started, started + count))
+            started += count
+        ids, winning_sides, plays = lockstep.step()
+        winners[ids] = winning_sides
+        # The engine's turn count starts at 1 and counts every play
+        turns[ids] = plays + 1
+    return winners, turns
+
+
+def playouts(positions, sides, seed=None):
+    '''Plays one random game from each bitboard position, all in lockstep, with the given side
+    to move in each. The positions must share a board size and must not be won already.
+    Returns an array of the winning side of each'''
+    lockstep = LockstepGames(positions[0].geometry, numpy.random.default_rng(seed))
+    rows = [position_rows(position) for position in positions]
+    lockstep.add([heights for heights, _ in rows], [workers for _, workers in rows], sides, range(len(positions)))
+    winners = numpy.zeros(len(positions), dtype=numpy.int8)
+    while len(lockstep):
+        ids, winning_sides, _ = lockstep.step()
+        winners[ids] = winning_sides
+    return winners
+
+
+def summarize(winners, turns, seconds):
+    '''Returns a summary of simulated games in the form of engine.play_games'''
+    games = len(winners)
+    blue_wins = int(winners.sum())
+    return {
+        'games': games,
+        'white_wins': games - blue_wins,
+        'blue_wins': blue_wins,
+        'average_turns': float(turns.mean()) if games else 0,
+        'seconds': seconds,
+        'games_per_second': games / seconds if seconds else 0,
+        # Random players search no transposition table
+        'white_table': None,
+        'blue_table': None,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Play random-vs-random games in lockstep with NumPy")
+    parser.add_argument('games', type=int, help="games to play")
+    parser.add_argument('--batch', type=int, default=DEFAULT_BATCH, metavar='N',
+                        help=f"games played side by side (default: {DEFAULT_BATCH})")
+    parser.add_argument('--seed', type=int, help="random seed")
+    parser.add_argument('--board-size', type=int, default=DEFAULT_SIZE, metavar='N',
+                        help=f"board size (default: {DEFAULT_SIZE})")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    winners, turns = simulate(args.games, args.board_size, args.batch, args.seed)
+    summary = summarize(winners, turns, time.perf_counter() - start)
+    games = summary['games']
+    print(f"{games} games: random (white) vs random (blue)")
+    print(f"white wins: {summary['white_wins']} ({summary['white_wins'] / games:.1%})")
+    print(f"blue wins: {summary['blue_wins']} ({summary['blue_wins'] / games:.1%})")
+    print(f"average turns: {summary['average_turns']:.1f}")
+    print(f"{summary['games_per_second']:.1f} games/s ({summary['seconds']:.2f}s)")
@@ -0,0 +1,128 @@
+import os
+import struct
+from game import GameState
+from geometry import MAX_SIZE
+
+# A snapshot starts with the magic and format version, then the board size, turn count,
+# side to move (0 white, 1 blue) and the squares of workers A, B, Y and Z. The heights
+# follow, two squares to a byte, then the two player types as length-prefixed ASCII strings
+MAGIC = b'SSNP'
+VERSION = 1
+HEADER = struct.Struct('<4sBBHB4B')
+SIDES = ('white', 'blue')
+
+
+class Snapshot:
+    '''The fields of a snapshot, read without building a game state'''
+    def __init__(self, board_size, turn_count, side, workers, heights, white_type, blue_type):
+        self.board_size = board_size
+        self.turn_count = turn_count
+        self.side = side
+        self.workers = workers
+        self.heights = heights
+        self.white_type = white_type
+        self.blue_type = blue_type
+
+
+def encode(state):
+    '''Packs a game state between rounds into a few dozen bytes'''
+    board = state.get_board()
+    position = board.get_bitboard()
+    squares = board.get_geometry().squares
+    player = state.get_curr_player()
+    if player is None:
+        # Managers set the player to move; otherwise it follows from the turn count
+        player = state.get_white() if state.get_turncount() % 2 == 1 else state.get_blue()
+    data = bytearray(HEADER.pack(MAGIC, VERSION, board.get_size(), state.get_turncount(),
+                                 SIDES.index(player.color), *position.workers))
+    heights = [position.height(sq) for sq in range(squares)] + [0]
+    for sq in range(0, squares, 2):
+        data.append(heights[sq] | heights[sq + 1] << 4)
+    for player in state.get_players():
+        name = player.type.encode('ascii')
+        data.append(len(name))
+        data += name
+    return bytes(data)
+
+
+def unpack(data):
+    '''Returns the Snapshot packed in data, raising ValueError if it is not a valid snapshot'''
+    if len(data) < HEADER.size:
+        raise ValueError("Not a game snapshot")
+    magic, version, board_size, turn_count, side, *workers = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a game snapshot")
+    if version != VERSION:
+        raise ValueError(f"Snapshot format version {version}, expected {VERSION}")
+    if not 4 <= board_size <= MAX_SIZE:
+        raise ValueError(f"Snapshot board size {board_size} is not supported")
+    squares = board_size * board_size
+    offset = HEADER.size
+    packed = data[offset:offset + (squares + 1) // 2]
+    offset += len(packed)
+    heights = []
+    for byte in packed:
+        heights += (byte & 15, byte >> 4)
+    heights = heights[:squares]
+    player_types = []
+    for _ in range(2):
+        if offset >= len(data) or offset + 1 + data[offset] > len(data):
+            raise ValueError("Snapshot is cut short")
+        player_types.append(bytes(data[offset + 1:offset + 1 + data[offset]]).decode('ascii'))
+        offset += 1 + data[offset]
+    if any(height > 4 for height in heights):
+        raise ValueError("Snapshot has a building taller than a dome")
+    if len(set(workers)) < 4 or any(sq >= squares or heights[sq] == 4 for sq in workers):
+        raise ValueError("Snapshot has workers off the board, on a dome or sharing a square")
+    if turn_count < 1 or side > 1 or side != (turn_count + 1) % 2:
+        raise ValueError(f"Snapshot has {SIDES[side % 2]} to move on turn {turn_count}")
+    return Snapshot(board_size, turn_count, side, workers, heights, *player_types)
+
+
+def decode(data, memento=False, score_display=False, playerWhite_settings=None, playerBlue_settings=None):
+    '''Returns a new GameState restored from a snapshot'''
+    snapshot = unpack(data)
+    state = GameState(snapshot.white_type, snapshot.blue_type, memento, score_display,
+                      playerWhite_settings, playerBlue_settings, snapshot.board_size)
+    board = state.get_board()
+    coords = board.get_geometry().coords
+    workers = [worker for player in state.get_players() for worker in player.get_workers()]
+    # Lift every worker off its starting square first, so none is placed on another's square
+    # and the buildings go up on an empty board
+    for worker in workers:
+        board.get_specific_cell(worker.x, worker.y).remove()
+    for sq, height in enumerate(snapshot.heights):
+        for _ in range(height):
+            state.build(*coords(sq))
+    for worker, sq in zip(workers, snapshot.workers):
+        row, col = coords(sq)
+        board.get_specific_cell(row, col).occupy(worker.name)
+        worker.update_pos(row, col)
+    state.set_turn_count(snapshot.turn_count)
+    state.set_curr_player(state.get_players()[snapshot.side])
+    return state
+
+
+def save(state, path):
+    '''Writes a snapshot of the game state to path. The snapshot is written to a temporary file
+    and renamed over the old one, so a crash never leaves a half-written snapshot behind'''
+    write(encode(state), path)
+
+
+def write(data, path):
+    '''Writes an encoded snapshot to path the way save does'''
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as output_file:
+        output_file.write(data)
+    os.replace(temporary, path)
+
+
+def read(path):
+    '''Returns the encoded snapshot stored at path'''
+    with open(path, 'rb') as input_file:
+        return input_file.read()
+
+
+def load(path, memento=False, score_display=False, playerWhite_settings=None, playerBlue_settings=None):
+    '''Returns a new GameState restored from the snapshot stored at path'''
+    return decode(read(path), memento, score_display, playerWhite_settings, playerBlue_settings)
@@ -0,0 +1,229 @@
+from bitboard import iter_bits
+from search import SIDE_WORKERS, generate_actions
+
+# Own moves searched for a forced win by the pre-pass; 2 proves wins on the move after next
+DEFAULT_DEPTH = 2
+
+
+def win_threats(position, side):
+    '''Returns {worker index: mask of height-3 squares it can step onto}, for each of the
+    side's workers standing on height 2 next to an unoccupied height-3 square'''
+    levels = position.levels
+    neighbor_masks = position.geometry.neighbor_masks
+    # Height exactly 3 and free: a worker on height 2 stepping there wins
+    summits = levels[2] & ~levels[3] & ~position.occupied
+    threats = {}
+    for index in SIDE_WORKERS[side]:
+        sq = position.workers[index]
+        if levels[1] >> sq & 1 and not levels[2] >> sq & 1:
+            targets = neighbor_masks[sq] & summits
+            if targets:
+                threats[index] = targets
+    return threats
+
+
+def winning_action(position, side):
+    '''Returns an action that wins on the spot for the side to move, or None. The worker
+    builds on the square it left, which is always possible'''
+    for index, targets in win_threats(position, side).items():
+        move_sq = next(iter_bits(targets))
+        return (index, move_sq, position.workers[index])
+    return None
+
+
+def _max_height(position, side):
+    return max(position.height(position.workers[index]) for index in SIDE_WORKERS[side])
+
+
+def forced_win(position, side, depth=DEFAULT_DEPTH):
+    '''Returns an action with which the side to move wins within depth of its own moves
+    whatever the opponent does, or None if there is none. Wins are moves onto height 3,
+    and moves before the last one that leave the opponent without a move'''
+    action = winning_action(position, side)
+    if action is not None or depth <= 1:
+        return action
+    opponent = 1 - side
+    # A worker climbs at most one level a move, so one must already stand this high
+    # after the move for a win to come in time
+    needed_height = 3 - (depth - 1)
+    # A move takes at most two squares from the opponent, the one moved onto and the one
+    # built on, so only an opponent with two or fewer squares to move to can be stalemated
+    opponent_reach = 0
+    for index in SIDE_WORKERS[opponent]:
+        opponent_reach |= position.reach[index]
+    can_stalemate = bin(opponent_reach).count('1') <= 2
+    levels = position.levels
+    # Squares at needed_height or higher
+    high = levels[needed_height - 1] if needed_height > 0 else -1
+    first, second = SIDE_WORKERS[side]
+    workers = position.workers
+    # Without a stalemate, a worker must stand that high after the move, where it stays
+    # or where it can step to
+    footing = position.reach[first] | position.reach[second] | 1 << workers[first] | 1 << workers[second]
+    if not can_stalemate and not footing & high:
+        return None
+    neighbor_masks = position.geometry.neighbor_masks
+    # Free height-3 squares, and height-2 squares a build raises to height 3
+    summits = levels[2] & ~levels[3] & ~position.occupied
+    raisable = levels[1] & ~levels[2]
+    # Squares next to an opponent worker on height 2, which it wins by stepping onto at height 3
+    opponent_threat_reach = 0
+    for index in SIDE_WORKERS[opponent]:
+        sq = workers[index]
+        if raisable >> sq & 1:
+            opponent_threat_reach |= neighbor_masks[sq]
+    for index, other in ((first, second), (second, first)):
+        other_sq = workers[other]
+        other_bit = 1 << other_sq
+        for move_sq, build_mask in position.generate_moves(index):
+            move_bit = 1 << move_sq
+            climbing = bool((move_bit | other_bit) & high)
+            # Builds worth playing: those that could stalemate the opponent, which must take
+            # every square it could move to, and those that could lead to a win
+            candidates = 0
+            if can_stalemate:
+                rest = opponent_reach & ~move_bit
+                if not rest & (rest - 1):
+                    candidates = build_mask & rest if rest else build_mask
+            if depth == 2:
+                # One move from the end, only an action that leaves a win threat can force a
+                # win. The threats are read from the masks instead of playing the action
+                threat_reach = 0
+                for sq in (move_sq, other_sq):
+                    if raisable >> sq & 1:
+                        threat_reach |= neighbor_masks[sq]
+                threats = threat_reach & summits & ~move_bit
+                candidates |= build_mask if threats else build_mask & threat_reach & raisable
+            elif climbing:
+                candidates = build_mask
+            for build_sq in iter_bits(candidates):
+                bit = 1 << build_sq
+                stalemates = can_stalemate and not opponent_reach & ~(move_bit | bit)
+                if depth == 2:
+                    open_summits = summits & ~move_bit
+                    if levels[2] & bit:
+                        # Domed
+                        open_summits &= ~bit
+                    elif levels[1] & bit:
+                        # Raised to height 3, and free even if it is the square just left
+                        open_summits |= bit
+                    action_threats = threat_reach & open_summits
+                    climbing = bool(action_threats)
+                    if action_threats and not stalemates:
+                        if opponent_threat_reach & open_summits:
+                            # The opponent wins first
+                            continue
+                        # The opponent can dome one threat at most, by moving next to it.
+                        # After the action it can still move where it can now, except onto
+                        # the squares moved onto and built on, and at most to the square just
+                        # left besides, so _threats_hold is mostly known without playing
+                        if action_threats & (action_threats - 1):
+                            return (index, move_sq, build_sq)
+                        domer_squares = neighbor_masks[action_threats.bit_length() - 1]
+                        if opponent_reach & domer_squares & ~(move_bit | bit):
+                            continue
+                        if not (opponent_reach | 1 << workers[index]) & domer_squares:
+                            return (index, move_sq, build_sq)
+                if not stalemates and not climbing:
+                    continue
+                from_sq = position.play(index, move_sq, build_sq)
+                try:
+                    if not any(position.reach[worker] for worker in SIDE_WORKERS[opponent]):
+                        return (index, move_sq, build_sq)
+                    if not climbing:
+                        continue
+                    if winning_action(position, opponent) is not None:
+                        continue
+                    if _refutes_all(position, side, depth - 1):
+                        return (index, move_sq, build_sq)
+                finally:
+                    position.undo(index, from_sq, build_sq)
+    return None
+
+
+def _refutes_all(position, side, depth):
+    # True if every opponent reply still leaves side a forced win within depth; the opponent
+    # having no reply at all loses it the game
+    if depth == 1:
+        return _threats_hold(position, side)
+    for reply in generate_actions(position, 1 - side):
+        index, move_sq, build_sq = reply
+        from_sq = position.play(index, move_sq, build_sq)
+        try:
+            if forced_win(position, side, depth) is None:
+                return False
+        finally:
+            position.undo(index, from_sq, build_sq)
+    return True
+
+
+def _threats_hold(position, side):
+    # True if the side wins next move whatever the opponent replies. The opponent cannot win
+    # itself here, so it cannot climb onto a threatened square either; its only defence is
+    # to dome it, which stops one threat at most
+    summits = 0
+    for targets in win_threats(position, side).values():
+        summits |= targets
+    if not summits:
+        return False
+    if summits & (summits - 1):
+        return True
+    neighbor_masks = position.geometry.neighbor_masks
+    for index in SIDE_WORKERS[1 - side]:
+        for move_sq in iter_bits(position.reach[index]):
+            if neighbor_masks[move_sq] & summits:
+                return False
+    return True
+
+
+def safe_actions(position, side):
+    '''Returns the side's actions after which the opponent cannot win on the spot. Works on
+    masks alone: an action changes the free height-3 squares only where it moves and builds'''
+    levels = position.levels
+    neighbor_masks = position.geometry.neighbor_masks
+    # Squares an opponent worker on height 2 could step onto
+    opponent_reach = 0
+    for index in SIDE_WORKERS[1 - side]:
+        sq = position.workers[index]
+        if position.height(sq) == 2:
+            opponent_reach |= neighbor_masks[sq]
+    summits = levels[2] & ~levels[3] & ~position.occupied
+    safe = []
+    for action in generate_actions(position, side):
+        index, move_sq, build_sq = action
+        # Moving onto height 3 wins before the opponent moves
+        if levels[2] >> move_sq & 1:
+            safe.append(action)
+            continue
+        open_summits = summits & ~(1 << move_sq)
+        if levels[2] >> build_sq & 1:
+            # Domed
+            open_summits &= ~(1 << build_sq)
+        elif levels[1] >> build_sq & 1:
+            # Raised to height 3
+            open_summits |= 1 << build_sq
+        if not open_summits & opponent_reach:
+            safe.append(action)
+    return safe
+
+
+def analyze(position, side, depth=DEFAULT_DEPTH):
+    '''The tactical pre-pass AI players run before their own evaluation. Returns
+    (action, safe): action is a winning or forced-win action, or the only move that stops
+    the opponent winning next turn, else None. safe lists the actions that stop an opponent
+    threat when there is one and only some of the actions do, else it is None and every
+    action may be evaluated'''
+    position = position.copy()
+    action = forced_win(position, side, depth)
+    if action is not None:
+        return action, None
+    # Only a worker on height 2 can win next turn, by an existing threat or one our build makes
+    if _max_height(position, 1 - side) < 2:
+        return None, None
+    safe = safe_actions(position, side)
+    if len(safe) == 1:
+        return safe[0], None
+    # With no safe action the game is lost anyway; let the player's evaluation choose
+    if not safe or len(safe) == len(generate_actions(position, side)):
+        return None, None
+    return None, safe
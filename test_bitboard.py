@@ -0,0 +1,51 @@
+import random
+import pytest
+from bitboard import Position, WORKER_NAMES
+from book import start_position
+from search import random_action
+
+GAMES = 100
+
+
+def rebuilt(position):
+    '''Returns a new position with the same buildings and workers, set up from scratch'''
+    fresh = Position(position.geometry)
+    for sq in range(position.geometry.squares):
+        for _ in range(position.height(sq)):
+            fresh.build(sq)
+    for name, sq in zip(WORKER_NAMES, position.workers):
+        fresh.place(name, sq)
+    return fresh
+
+
+def assert_index_matches(position):
+    fresh = rebuilt(position)
+    assert position.reach == fresh.reach
+    assert position.buildable == fresh.buildable
+    assert position.occupied == fresh.occupied
+    assert position.hash == fresh.hash
+    assert position.won == fresh.won
+    for name in WORKER_NAMES:
+        assert position.enumerate_moves(name) == fresh.enumerate_moves(name)
+
+
+@pytest.mark.parametrize('board_size', (4, 5, 7))
+def test_index_matches_rebuilt_position(board_size):
+    # Random games that take back about one turn in five, checked after every play and undo
+    rng = random.Random(board_size)
+    for _ in range(GAMES):
+        position = start_position(board_size)
+        side = 0
+        played = []
+        while not position.won:
+            action = random_action(position, side, rng)
+            if action is None:
+                break
+            played.append((action[0], position.play(*action), action[2]))
+            assert_index_matches(position)
+            if rng.random() < 0.2:
+                position.undo(*played.pop())
+                assert_index_matches(position)
+            else:
+                side = 1 - side
+        assert_index_matches(position.copy())
@@ -0,0 +1,28 @@
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+from bitboard import Position, WORKER_NAMES
+from geometry import DEFAULT_SIZE, get_geometry
+from simulate import playouts
+
+
+def walled_in_position():
+    '''Returns a position where White cannot move: both of its workers sit in corners walled
+    in by height-3 towers'''
+    geometry = get_geometry(DEFAULT_SIZE)
+    position = Position(geometry)
+    for name, (row, col) in zip(WORKER_NAMES, ((0, 0), (0, 4), (2, 2), (3, 3))):
+        position.place(name, geometry.square(row, col))
+    for row, col in ((0, 1), (1, 0), (1, 1), (0, 3), (1, 3), (1, 4)):
+        for _ in range(3):
+            position.build(geometry.square(row, col))
+    return position
+
+
+def test_side_with_no_move_loses():
+    # A stuck row still picks a move, which must not count as a win onto a height-3 tower
+    position = walled_in_position()
+    assert not any(position.reach[index] for index in (0, 1))
+    winners = playouts([position] * 1000, [0] * 1000, seed=1)
+    assert (winners == 0).sum() == 0
@@ -0,0 +1,99 @@
+import random
+import pytest
+from book import start_position
+from geometry import DEFAULT_SIZE
+from search import SIDE_WORKERS, generate_actions, random_action
+import tactics
+
+# Positions taken from seeded random games, by board size and the forced-win depth searched
+# on them. The brute-force search grows quickly with depth, so deeper searches get fewer
+# positions; the 4x4 board is quicker to search and cramped enough for stalemates to come up
+POSITIONS = {
+    4: {1: 1500, 2: 1500, 3: 100},
+    5: {1: 1500, 2: 600, 3: 60},
+}
+
+
+def positions(count, seed=0, board_size=DEFAULT_SIZE):
+    '''Returns count (position, side to move) pairs from random games of random lengths,
+    leaving out finished games and sides that cannot move'''
+    rng = random.Random(seed)
+    found = []
+    while len(found) < count:
+        position = start_position(board_size)
+        side = 0
+        for _ in range(rng.randrange(4, 40)):
+            action = random_action(position, side, rng)
+            if action is None or position.won:
+                break
+            position.play(*action)
+            side = 1 - side
+        if not position.won and any(position.reach[index] for index in SIDE_WORKERS[side]):
+            found.append((position, side))
+    return found
+
+
+def wins_now(position, side):
+    # A worker of the side can step onto a height-3 square
+    summits = position.levels[2] & ~position.levels[3]
+    return any(position.reach[index] & summits for index in SIDE_WORKERS[side])
+
+
+def action_forces_win(position, side, action, depth):
+    '''Returns True if the action wins within depth of the side's own moves whatever the
+    opponent replies, trying every reply'''
+    index, move_sq, build_sq = action
+    if position.height(move_sq) == 3:
+        return True
+    if depth <= 1:
+        return False
+    from_sq = position.play(index, move_sq, build_sq)
+    try:
+        if not any(position.reach[worker] for worker in SIDE_WORKERS[1 - side]):
+            return True
+        if wins_now(position, 1 - side):
+            return False
+        for reply in generate_actions(position, 1 - side):
+            reply_from = position.play(*reply)
+            try:
+                if not has_forced_win(position, side, depth - 1):
+                    return False
+            finally:
+                position.undo(reply[0], reply_from, reply[2])
+        return True
+    finally:
+        position.undo(index, from_sq, build_sq)
+
+
+def has_forced_win(position, side, depth):
+    '''Returns True if some action of the side to move forces a win within depth'''
+    if depth <= 1:
+        return wins_now(position, side)
+    return any(action_forces_win(position, side, action, depth) for action in generate_actions(position, side))
+
+
+@pytest.mark.parametrize('board_size, depth', [(size, depth) for size in POSITIONS for depth in POSITIONS[size]])
+def test_forced_win_matches_brute_force(board_size, depth):
+    wins = 0
+    for position, side in positions(POSITIONS[board_size][depth], depth, board_size):
+        key = position.key(side)
+        action = tactics.forced_win(position, side, depth)
+        assert position.key(side) == key
+        assert (action is not None) == has_forced_win(position, side, depth)
+        if action is not None:
+            assert action_forces_win(position, side, action, depth)
+            wins += 1
+    # The positions must hold wins to check, not only positions without one
+    assert wins
+
+
+@pytest.mark.parametrize('board_size', sorted(POSITIONS))
+def test_safe_actions_match_brute_force(board_size):
+    for position, side in positions(1500, 0, board_size):
+        safe = []
+        for action in generate_actions(position, side):
+            from_sq = position.play(*action)
+            if position.won or not wins_now(position, 1 - side):
+                safe.append(action)
+            position.undo(action[0], from_sq, action[2])
+        assert sorted(tactics.safe_actions(position, side)) == sorted(safe)
@@ -0,0 +1,148 @@
+import itertools
+import json
+import math
+import multiprocessing
+import os
+from engine import play_game
+from geometry import DEFAULT_SIZE
+
+
+def schedule(player_types, games, seed=0):
+    '''Returns the round-robin schedule: every ordered pairing of distinct player types plays
+    the given number of games, so each pair meets equally often as white and as blue.
+    Each game is a dict with a stable id, the player types and its seed'''
+    pairings = list(itertools.permutations(player_types, 2))
+    jobs = []
+    for game_index in range(games):
+        for white, blue in pairings:
+            jobs.append({
+                'id': f'{white}-{blue}-{game_index}',
+                'white': white,
+                'blue': blue,
+                'seed': seed + len(jobs),
+            })
+    return jobs
+
+
+def load_results(path):
+    '''Returns the results already recorded in the results file, keyed by game id.
+    A line cut short by an interrupted run is ignored and its game is played again'''
+    results = {}
+    if not os.path.exists(path):
+        return results
+    with open(path) as results_file:
+        for line in results_file:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            results[result['id']] = result
+    return results
+
+
+def _ends_with_newline(path):
+    # An empty or missing file counts as ending cleanly
+    if not os.path.exists(path) or not os.path.getsize(path):
+        return True
+    with open(path, 'rb') as results_file:
+        results_file.seek(-1, os.SEEK_END)
+        return results_file.read(1) == b'\n'
+
+
+def _play_job(job):
+    # Runs in a pool worker. Pool workers cannot start pools of their own,
+    # so search players run their playouts in-process
+    settings = dict(job['settings'], processes=1)
+    winner, turns = play_game(job['white'], job['blue'], job['seed'], settings, settings, job['board_size'])
+    return {
+        'id': job['id'],
+        'white': job['white'],
+        'blue': job['blue'],
+        'seed': job['seed'],
+        'board_size': job['board_size'],
+        'settings': job['settings'],
+        'winner': winner,
+        'turns': turns,
+    }
+
+
+def run_tournament(player_types, games, results_path, seed=0, processes=None, settings=None, progress=None,
+                   board_size=DEFAULT_SIZE):
+    '''Plays every game of the schedule that the results file does not already hold, on a
+    process pool, appending each result to the file as soon as its game finishes.
+    Returns the results of every scheduled game, old and new. Raises ValueError if the file
+    holds a scheduled game played with another seed, board size or settings'''
+    results = load_results(results_path)
+    scheduled = schedule(player_types, games, seed)
+    # Compare settings as they read back from the file, where tuples are lists
+    settings = json.loads(json.dumps(settings or {}))
+    for job in scheduled:
+        result = results.get(job['id'])
+        if result is not None and (result['seed'], result['board_size'], result.get('settings')) != \
+                (job['seed'], board_size, settings):
+            raise ValueError(f"{results_path} holds game {job['id']} from a tournament with other parameters. "
+                             "Resume with the same player types, --seed, --board-size and settings, "
+                             "or use another results file")
+    jobs = [dict(job, settings=settings, board_size=board_size) for job in scheduled if job['id'] not in results]
+    if jobs:
+        complete_last_line = _ends_with_newline(results_path)
+        with open(results_path, 'a') as results_file, multiprocessing.Pool(processes) as pool:
+            # Start on a fresh line in case the last run was cut off mid-write
+            if not complete_last_line:
+                results_file.write('\n')
+            for result in pool.imap_unordered(_play_job, jobs):
+                results_file.write(json.dumps(result) + '\n')
+                results_file.flush()
+                results[result['id']] = result
+                if progress is not None:
+                    progress(result)
+    return [results[job['id']] for job in scheduled]
+
+
+def wilson_interval(wins, games, z=1.96):
+    '''Returns the Wilson score interval for a win rate, 95% by default'''
+    if not games:
+        return 0.0, 1.0
+    rate = wins / games
+    denominator = 1 + z * z / games
+    center = (rate + z * z / (2 * games)) / denominator
+    margin = z * math.sqrt(rate * (1 - rate) / games + z * z / (4 * games * games)) / denominator
+    return center - margin, center + margin
+
+
+def summarize(results, player_types):
+    '''Returns the standings as a list of (player type, wins, games, low, high) rows, with the
+    95% confidence interval of each type's win rate, best first'''
+    rows = []
+    for player_type in player_types:
+        played = [result for result in results if player_type in (result['white'], result['blue'])]
+        wins = sum(1 for result in played if result[result['winner']] == player_type)
+        low, high = wilson_interval(wins, len(played))
+        rows.append((player_type, wins, len(played), low, high))
+    rows.sort(key=lambda row: row[1] / row[2] if row[2] else 0, reverse=True)
+    return rows
+
+
+def head_to_head(results, player_types):
+    '''Returns (player type, opponent type, wins, games) for every pairing'''
+    rows = []
+    for player_type, opponent in itertools.permutations(player_types, 2):
+        played = [result for result in results if {result['white'], result['blue']} == {player_type, opponent}]
+        wins = sum(1 for result in played if result[result['winner']] == player_type)
+        rows.append((player_type, opponent, wins, len(played)))
+    return rows
+
+
+def print_report(results, player_types):
+    '''Prints the standings and the head-to-head results'''
+    turns = [result['turns'] for result in results]
+    print(f"{len(results)} games, average length {sum(turns) / len(turns) if turns else 0:.1f} turns")
+    print(f"{'player':<12}{'wins':>7}{'games':>7}{'win rate':>10}  95% CI")
+    for player_type, wins, games, low, high in summarize(results, player_types):
+        rate = wins / games if games else 0
+        print(f"{player_type:<12}{wins:>7}{games:>7}{rate:>10.1%}  [{low:.1%}, {high:.1%}]")
+    print()
+    for player_type, opponent, wins, games in head_to_head(results, player_types):
+        if player_type < opponent and games:
+            low, high = wilson_interval(wins, games)
+            print(f"{player_type} vs {opponent}: {wins}/{games} ({wins / games:.1%}, 95% CI [{low:.1%}, {high:.1%}])")
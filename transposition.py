@@ -0,0 +1,56 @@
+# Bound types of a stored score
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class TranspositionTable:
+    '''Fixed-size table of search results keyed by a position's Zobrist hash.
+    Each slot holds one (key, depth, score, bound, best move, generation) entry. A new result
+    replaces the slot's entry if that entry is for the same position, was stored during an
+    earlier search, or was searched no deeper, so memory stays bounded while deep results
+    from the current search survive'''
+    def __init__(self, size=1 << 16):
+        # Round up to a power of two so a slot is found by masking the key
+        self._size = 1 << max(size - 1, 1).bit_length()
+        self._mask = self._size - 1
+        self._slots = [None] * self._size
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def new_search(self):
+        '''Marks the start of a new search, so entries from earlier searches age out first'''
+        self._generation += 1
+
+    def lookup(self, key):
+        '''Returns the (depth, score, bound, best move) stored for the key, or None'''
+        entry = self._slots[key & self._mask]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[1:5]
+        self.misses += 1
+        return None
+
+    def store(self, key, depth, score, bound, move):
+        '''Stores a search result for the key, subject to the replacement policy'''
+        slot = key & self._mask
+        entry = self._slots[slot]
+        if entry is None or entry[0] == key or entry[5] != self._generation or depth >= entry[1]:
+            self._slots[slot] = (key, depth, score, bound, move, self._generation)
+            self.stores += 1
+
+    def clear(self):
+        '''Empties the table and resets its counters'''
+        self._slots = [None] * self._size
+        self.hits = self.misses = self.stores = 0
+
+    def stats(self):
+        '''Returns the table's hit/miss counters'''
+        probes = self.hits + self.misses
+        return {
+            'size': self._size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'stores': self.stores,
+            'hit_rate': self.hits / probes if probes else 0.0,
+        }
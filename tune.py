@@ -0,0 +1,194 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import time
+from engine import play_game
+from geometry import DEFAULT_SIZE
+from turn import HeuristicTurn
+
+# SPSA gains: step size a / (k + 1 + stability) ** ALPHA and perturbation c / (k + 1) ** GAMMA
+# at iteration k, with the decay exponents Spall recommends
+DEFAULT_A = 2.0
+DEFAULT_C = 0.5
+ALPHA, GAMMA = 0.602, 0.101
+DEFAULT_ITERATIONS = 200
+DEFAULT_GAMES = 64
+CHECKPOINT_PATH = 'tune_checkpoint.json'
+WEIGHTS_PATH = 'weights.json'
+
+
+def load_weights(path):
+    '''Returns the (height, center, distance) weights stored in a weights file'''
+    with open(path) as weights_file:
+        return tuple(json.load(weights_file)['weights'])
+
+
+def save_weights(path, weights, **info):
+    '''Writes weights, and any information about how they were found, as a weights file'''
+    _write_json(path, dict(info, weights=list(weights)))
+
+
+def _write_json(path, data):
+    # Write to a temporary file and rename it over the old one, so an interrupted write
+    # never leaves a half-written checkpoint behind
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as output_file:
+        json.dump(data, output_file, indent=2)
+    os.replace(temporary, path)
+
+
+def _play_job(job):
+    # Runs in a pool worker: plays one game and returns 1 if the first weights won, else 0
+    first, second, first_is_white, seed, settings, board_size = job
+    first_settings = dict(settings, weights=tuple(first))
+    second_settings = dict(settings, weights=tuple(second))
+    if first_is_white:
+        winner, _ = play_game('heuristic', 'heuristic', seed, first_settings, second_settings, board_size)
+        return int(winner == 'white')
+    winner, _ = play_game('heuristic', 'heuristic', seed, second_settings, first_settings, board_size)
+    return int(winner == 'blue')
+
+
+def match(pool, first, second, games, seed, settings=None, board_size=DEFAULT_SIZE):
+    '''Plays games between two weight vectors on the pool and returns the first one's score
+    from 0 to 1. Games come in pairs with the same seed and the colors swapped, so neither
+    weight vector gains from moving first'''
+    jobs = [(first, second, game_index % 2 == 0, seed + game_index // 2, settings or {}, board_size)
+            for game_index in range(games)]
+    return sum(pool.imap_unordered(_play_job, jobs)) / games
+
+
+class SPSATuner:
+    '''Tunes the heuristic weights with simultaneous perturbation stochastic approximation.
+    Each iteration perturbs every weight at once by +-c_k, plays the two perturbed vectors
+    against each other, and steps along the resulting gradient estimate. Its state is saved
+    to a checkpoint after every iteration, so an interrupted run picks up where it stopped'''
+    def __init__(self, checkpoint_path=CHECKPOINT_PATH, weights=HeuristicTurn.DEFAULT_WEIGHTS,
+                 iterations=DEFAULT_ITERATIONS, games=DEFAULT_GAMES, a=DEFAULT_A, c=DEFAULT_C,
+                 seed=0, settings=None, board_size=DEFAULT_SIZE):
+        if games < 2 or games % 2:
+            raise ValueError(f"Games per iteration must be a positive even number, got {games}")
+        self._checkpoint_path = checkpoint_path
+        self.iterations = iterations
+        self.games = games
+        self.a = a
+        self.c = c
+        # A stability constant of a tenth of the run keeps the first steps from overshooting
+        self.stability = iterations / 10
+        self.seed = seed
+        self.settings = dict(settings or {})
+        self.board_size = board_size
+        self.iteration = 0
+        self.weights = list(weights)
+        self.history = []
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            self._load()
+
+    def _load(self):
+        with open(self._checkpoint_path) as checkpoint_file:
+            state = json.load(checkpoint_file)
+        # Steps taken with other parameters would mix two runs into one
+        for name in ('iterations', 'games', 'a', 'c', 'seed', 'board_size', 'settings'):
+            if state.get(name) != getattr(self, name):
+                raise ValueError(f"{self._checkpoint_path} is from a run with {name} {state.get(name)}, "
+                                 f"not {getattr(self, name)}. Resume with the same options or use another checkpoint")
+        self.iteration = state['iteration']
+        self.weights = state['weights']
+        self.history = state['history']
+
+    def _save(self):
+        _write_json(self._checkpoint_path, {
+            'iteration': self.iteration,
+            'weights': self.weights,
+            'history': self.history,
+            'iterations': self.iterations,
+            'games': self.games,
+            'a': self.a,
+            'c': self.c,
+            'seed': self.seed,
+            'board_size': self.board_size,
+            'settings': self.settings,
+        })
+
+    def step(self, pool):
+        '''Runs one iteration and returns its history entry'''
+        k = self.iteration
+        a_k = self.a / (k + 1 + self.stability) ** ALPHA
+        c_k = self.c / (k + 1) ** GAMMA
+        # The perturbation depends only on the seed and iteration, so a resumed run repeats it
+        rng = random.Random(self.seed * 1000003 + k)
+        delta = [rng.choice((-1, 1)) for _ in self.weights]
+        plus = [weight + c_k * sign for weight, sign in zip(self.weights, delta)]
+        minus = [weight - c_k * sign for weight, sign in zip(self.weights, delta)]
+        # Each iteration plays fresh seeds
+        score = match(pool, plus, minus, self.games, self.seed + k * self.games, self.settings, self.board_size)
+        # Score 0.5 is a draw between the two; weights are kept non-negative
+        gradient = [(2 * score - 1) / (2 * c_k * sign) for sign in delta]
+        self.weights = [max(0.0, weight + a_k * step) for weight, step in zip(self.weights, gradient)]
+        self.iteration += 1
+        entry = {'iteration': self.iteration, 'score': score, 'weights': self.weights}
+        self.history.append(entry)
+        if self._checkpoint_path:
+            self._save()
+        return entry
+
+    def run(self, processes=None, progress=None):
+        '''Runs the remaining iterations on a process pool and returns the tuned weights'''
+        with multiprocessing.Pool(processes) as pool:
+            while self.iteration < self.iterations:
+                entry = self.step(pool)
+                if progress is not None:
+                    progress(entry)
+        return tuple(self.weights)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Tune the heuristic weights with SPSA over parallel self-play")
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS, metavar='N',
+                        help=f"SPSA iterations (default: {DEFAULT_ITERATIONS})")
+    parser.add_argument('--games', type=int, default=DEFAULT_GAMES, metavar='N',
+                        help=f"games per iteration, an even number (default: {DEFAULT_GAMES})")
+    parser.add_argument('--start', type=float, nargs=3, default=HeuristicTurn.DEFAULT_WEIGHTS,
+                        metavar=('HEIGHT', 'CENTER', 'DISTANCE'),
+                        help="weights to start from (default: the built-in weights)")
+    parser.add_argument('-a', type=float, default=DEFAULT_A, help=f"SPSA step size (default: {DEFAULT_A})")
+    parser.add_argument('-c', type=float, default=DEFAULT_C, help=f"SPSA perturbation size (default: {DEFAULT_C})")
+    parser.add_argument('--validate', type=int, default=0, metavar='N',
+                        help="finally play N games of the tuned weights against the start weights")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the perturbations and games (default: 0)")
+    parser.add_argument('--board-size', type=int, default=DEFAULT_SIZE, metavar='N',
+                        help=f"board size to tune on (default: {DEFAULT_SIZE})")
+    parser.add_argument('--no-book', dest='book', action='store_false', help="play without the opening book")
+    parser.add_argument('--no-tactics', dest='tactics', action='store_false',
+                        help="play without the tactical pre-pass")
+    parser.add_argument('--workers', type=int, metavar='N', help="game processes (default: all cores)")
+    parser.add_argument('--checkpoint', default=CHECKPOINT_PATH, metavar='FILE',
+                        help=f"progress file, resumed from if it exists (default: {CHECKPOINT_PATH})")
+    parser.add_argument('--output', default=WEIGHTS_PATH, metavar='FILE',
+                        help=f"where to write the tuned weights (default: {WEIGHTS_PATH})")
+    args = parser.parse_args()
+
+    settings = {'book': args.book, 'tactics': args.tactics}
+    try:
+        tuner = SPSATuner(args.checkpoint, args.start, args.iterations, args.games, args.a, args.c,
+                          args.seed, settings, args.board_size)
+    except ValueError as error:
+        raise SystemExit(str(error))
+    if tuner.iteration:
+        print(f"Resuming from iteration {tuner.iteration} of {args.checkpoint}")
+    start = time.perf_counter()
+    weights = tuner.run(args.workers, progress=lambda entry: print(
+        f"{entry['iteration']:>5}/{tuner.iterations}  score {entry['score']:.3f}  weights "
+        + ' '.join(f"{weight:.3f}" for weight in entry['weights']), flush=True))
+    info = {'iterations': tuner.iterations, 'games': tuner.iterations * tuner.games, 'board_size': args.board_size}
+    if args.validate:
+        with multiprocessing.Pool(args.workers) as pool:
+            # Seeds past those the tuning played
+            score = match(pool, weights, args.start, args.validate, args.seed + tuner.iterations * tuner.games,
+                          settings, args.board_size)
+        print(f"Tuned weights scored {score:.1%} against {' '.join(map(str, args.start))} over {args.validate} games")
+        info['validation_score'] = score
+    save_weights(args.output, weights, **info)
+    print(f"Wrote {args.output} in {time.perf_counter() - start:.0f}s")
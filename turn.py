@@ -1,10 +1,53 @@
+import functools
 import random
-from player import DIRECTION
+import weakref
+from bitboard import WORKER_NAMES, iter_bits
+from book import get_book
+import tactics
+from search import AlphaBetaSearch, random_action, side_of, SIDE_WORKERS, HEIGHT_WEIGHT, CENTER_WEIGHT, DISTANCE_WEIGHT
+from mcts import MonteCarloTreeSearch
+from transposition import TranspositionTable
 from command import MoveCommand, BuildCommand
-import tkinter.messagebox
+
+# Height planes are shifted as int64, so boards of more than 63 squares are scored one move at a time
+NUMPY_MAX_SQUARES = 63
+
+
+@functools.lru_cache(maxsize=None)
+def _numpy():
+    # NumPy is optional; without it HeuristicTurn scores candidate moves one at a time. It is
+    # imported when a heuristic player first scores moves, as importing it takes longer than
+    # starting the rest of the engine
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+@functools.lru_cache(maxsize=None)
+def _geometry_arrays(geometry):
+    # Ring and distance tables of a board size as NumPy arrays, built once per size
+    numpy = _numpy()
+    return numpy.array(geometry.ring), numpy.array(geometry.distance)
+
+# Search state that outlives a single turn, such as transposition tables, kept per player
+_player_caches = weakref.WeakKeyDictionary()
+
+
+def transposition_stats(player):
+    '''Returns the counters of the player's transposition table, or None if the player's
+    searches have not used one'''
+    table = _player_caches.get(player, {}).get('table')
+    return table.stats() if table is not None else None
+
 
 class TurnTemplate:
-    '''A template for a turn, which can be human-made, randomly-made, or heuristically-made'''
+    '''A template for a turn, which can be human-made, randomly-made, or heuristically-made.
+    gui is the game manager the turn plays against: SantoriniGUI or the headless GameEngine.
+    Either one provides move, build, check_game_end and get_both_players.
+    AI turns split into decide, which only reads the game and may run on a worker thread,
+    and play, which moves and builds through the manager'''
     def __init__(self, board, player, gui):
         self._board = board
         self._player = player
@@ -20,8 +63,60 @@ class TurnTemplate:
         build_command = BuildCommand(self._gui)
         build_command.execute(row, col)
 
+    def _play_action(self, action):
+        '''Moves and builds as described by a (worker index, move square, build square) action'''
+        index, move_sq, build_sq = action
+        worker = self._player.select_worker(WORKER_NAMES[index])
+        geometry = self._board.get_geometry()
+        move_x, move_y = geometry.coords(move_sq)
+        build_x, build_y = geometry.coords(build_sq)
+        self._move(move_x, move_y, worker.x, worker.y, worker)
+        self._build(build_x, build_y)
+
+    def _transposition_table(self):
+        '''Returns the player's transposition table, creating it on first use, so search
+        results carry over from one turn to the next'''
+        cache = _player_caches.setdefault(self._player, {})
+        if 'table' not in cache:
+            cache['table'] = TranspositionTable(self._player.settings.get('table_size', 1 << 16))
+        return cache['table']
+
+    def _book_action(self):
+        '''Returns the opening book's action for the current position, or None if the position
+        is not in the book or the player's book setting is off'''
+        if not self._player.settings.get('book', True):
+            return None
+        book = get_book(self._board.get_size())
+        if book is None:
+            return None
+        return book.lookup(self._board.get_bitboard(), side_of(self._player))
+
+    def _tactics(self):
+        '''Runs the tactical pre-pass for the player. Returns (action, safe) as tactics.analyze
+        does, or (None, None) if the player's tactics setting is off'''
+        settings = self._player.settings
+        if not settings.get('tactics', True):
+            return None, None
+        return tactics.analyze(self._board.get_bitboard(), side_of(self._player),
+                               settings.get('tactics_depth', tactics.DEFAULT_DEPTH))
+
+    def decide(self):
+        '''Chooses the turn's move and build without playing them. Returns the decision for
+        play, or None if neither worker can move'''
+        raise NotImplementedError("AI turns must implement the decide method.")
+
+    def play(self, decision):
+        '''Plays a (worker index, move square, build square) action chosen by decide, or
+        ends the game if there was none'''
+        # If neither worker can move, end the game
+        if decision is None:
+            self._gui.check_game_end(self._player, othercondition=True)
+            return
+        self._play_action(decision)
+
     def run(self):
-        raise NotImplementedError("Subclasses must implement the run method.")
+        '''Decides and plays the turn'''
+        self.play(self.decide())
 
 
 class HumanTurn(TurnTemplate):
@@ -31,8 +126,9 @@ class HumanTurn(TurnTemplate):
 
     # Binds select function to each button
     def _bind_select(self):
-        for row in range(5):
-            for col in range(5):
+        size = self._board.get_size()
+        for row in range(size):
+            for col in range(size):
                 self._gui.buttons[row][col].bind("<Button-1>", lambda event, r=row, c=col: self._verify_valid_worker(r, c))
 
     # Verifies that selected worker is valid before allowing actual selection
@@ -41,83 +137,81 @@ class HumanTurn(TurnTemplate):
         workername = cell.get_occupying_worker()
 
         if self._player.color == 'white' and (workername == 'Y' or workername == 'Z'):
-            tkinter.messagebox.showwarning(title=None, message=("That is not your worker"))
+            self._gui._messagebox("That is not your worker")
         elif self._player.color == 'blue' and (workername == 'A' or workername == 'B'):
-            tkinter.messagebox.showwarning(title=None, message=("That is not your worker"))
+            self._gui._messagebox("That is not your worker")
         elif not self._player.check_valid_worker(workername):
-            tkinter.messagebox.showwarning(title=None, message=("Not a valid worker"))
+            self._gui._messagebox("Not a valid worker")
         else:
             worker = self._player.select_worker(workername)
             if worker.no_moves_left(self._board):
-                tkinter.messagebox.showwarning(title=None, message=("That worker cannot move"))
+                self._gui._messagebox("That worker cannot move")
                 return
             self._select_worker(row, col, workername)
 
     def _select_worker(self, row, col, worker):        
-        cell = self._board.get_specific_cell(row, col)
         worker = self._player.select_worker(worker)
         
-        # Remove all button functionality and bind move function to valid adjacent buttons
+        # Remove all button functionality and bind move function to the cells the worker can reach
         self._gui._unbind_buttons()
-        adjacent_positions = [
-            (row-1, col-1), (row-1, col), (row-1, col+1),
-            (row, col-1),                 (row, col+1),
-            (row+1, col-1), (row+1, col), (row+1, col+1)
-        ]
-        for adj_row, adj_col in adjacent_positions:
-            if self._board.in_bounds(adj_row, adj_col):
-                adj_cell = self._board.get_specific_cell(adj_row, adj_col)
-                if adj_cell.is_valid_move(cell):
-                    self._gui.buttons[adj_row][adj_col].bind("<Button-1>", lambda event, 
-                                                         r=adj_row, c=adj_col, old_r=row, old_c=col, w=worker: self._move(r, c, old_r, old_c, w))
-                    self._gui.buttons[adj_row][adj_col].config(bg="#FFFFE0")
+        for adj_row, adj_col in worker.get_reachable_cells(self._board):
+            self._gui.buttons[adj_row][adj_col].bind("<Button-1>", lambda event, 
+                                                     r=adj_row, c=adj_col, old_r=row, old_c=col, w=worker: self._move(r, c, old_r, old_c, w))
+            self._gui._highlight(adj_row, adj_col)
 
 
 class RandomTurn(TurnTemplate):
     '''Randomly decides which worker to use, where to move, and where to build to'''
-    def run(self):
-        # Randomly choose worker
-        worker = random.choice(self._player.get_workers())
-
-        # Get all possible moves and corresponding build directions for that worker
-        worker_moves = worker.enumerate_moves(self._board)
-
-        # If no moves available...
-        if worker_moves == {}:
-            # Try to move other worker
-            workers = self._player.get_workers()
-            if worker == workers[0]:
-                worker = workers[1]
-            else:
-                worker = workers[0]
-            # Get other worker's possible moves
-            worker_moves = worker.enumerate_moves(self._board)
-            # If other worker also has no moves left, end the game
-            if worker_moves == {}:
-                self._gui.check_game_end(self._player, othercondition=True)
-                return
-            
-        # Randomly choose move direction, represented by the keys in the dictionary
-        move_dir = random.choice(list(worker_moves.keys()))
-
-        # Randomly choose build direction, represented by the values of the move direction key
-        build_dir = random.choice(worker_moves[move_dir])
-
-        move_x = worker.x + DIRECTION[move_dir]['x']
-        move_y = worker.y + DIRECTION[move_dir]['y']
-        build_x = move_x + DIRECTION[build_dir]['x']
-        build_y = move_y + DIRECTION[build_dir]['y']
-
-        # Move and build in that given direction
-        self._move(move_x, move_y, worker.x, worker.y, worker)
-        self._build(build_x, build_y)
+    def decide(self):
+        # Randomly choose a worker that can move, then a move direction and a build direction
+        return random_action(self._board.get_bitboard(), side_of(self._player))
 
 
 class HeuristicTurn(TurnTemplate):
-    '''Calculates move score based on certain critera and moves worker that has the highest move score'''
-    def run(self):
+    '''Calculates move score based on certain critera and moves worker that has the highest move score.
+    The player's 'weights' setting, a (height, center, distance) triple, replaces the default weights'''
+    DEFAULT_WEIGHTS = (HEIGHT_WEIGHT, CENTER_WEIGHT, DISTANCE_WEIGHT)
+
+    def decide(self):
+        # Play the opening book's move in book positions
+        action = self._book_action()
+        if action is not None:
+            return self._move_data(action)
+        # Take a win, or stop the opponent's, before scoring moves
+        action, safe = self._tactics()
+        if action is not None:
+            return self._move_data(action)
+        if safe is not None:
+            return self._best_safe_move_data(safe)
         # Get list containing the best move data
-        best_move_data = self.get_best_move_data()
+        return self.get_best_move_data()
+
+    # Scores only the given actions, when the others would let the opponent win
+    def _best_safe_move_data(self, actions):
+        move_data = [self._move_data(action) for action in actions]
+        scores = [self._calculate_move_score(*data[3:]) for data in move_data]
+        best_score = max(scores)
+        return random.choice([data for data, score in zip(move_data, scores) if score == best_score])
+
+    # Describes a (worker index, move square, build square) action in get_best_move_data's form
+    def _move_data(self, action):
+        index, move_sq, build_sq = action
+        geometry = self._board.get_geometry()
+        worker = self._player.select_worker(WORKER_NAMES[index])
+        move_x, move_y = geometry.coords(move_sq)
+        height_score = self._calculate_height_score(worker, move_x, move_y)
+        center_score = self._calculate_center_score(worker, move_x, move_y)
+        distance_score = self._calculate_distance_score(worker, move_x, move_y)
+        return [worker,
+                geometry.direction_between[(geometry.square(worker.x, worker.y), move_sq)],
+                geometry.direction_between[(move_sq, build_sq)],
+                height_score, center_score, distance_score]
+
+    def play(self, best_move_data):
+        # If neither worker can move, end the game
+        if best_move_data is None:
+            self._gui.check_game_end(self._player, othercondition=True)
+            return
 
         # Assign corresponding data points in list to variables
         worker = best_move_data[0]
@@ -127,10 +221,9 @@ class HeuristicTurn(TurnTemplate):
         center_score = best_move_data[4]
         distance_score = best_move_data[5]
 
-        move_x = worker.x + DIRECTION[move_dir]['x']
-        move_y = worker.y + DIRECTION[move_dir]['y']
-        build_x = move_x + DIRECTION[build_dir]['x']
-        build_y = move_y + DIRECTION[build_dir]['y']
+        step = self._board.get_geometry().step
+        move_x, move_y = step[(worker.x, worker.y)][move_dir]
+        build_x, build_y = step[(move_x, move_y)][build_dir]
 
         # Move player in best direction, build in best direction
         self._move(move_x, move_y, worker.x, worker.y, worker)
@@ -139,7 +232,10 @@ class HeuristicTurn(TurnTemplate):
     def get_best_move_data(self):
         '''Iterates through every possible move and corresponding build direction and finds
         which combination would yield the highest move score. Returns a list containing the best
-        worker to move, move direction, build direction, and height/center/distance scores'''
+        worker to move, move direction, build direction, and height/center/distance scores,
+        or None if neither worker can move'''
+        if self._board.get_geometry().squares <= NUMPY_MAX_SQUARES and _numpy() is not None:
+            return self._get_best_move_data_vectorized()
 
         # Get current player's workers
         workers = self._player.get_workers()
@@ -152,27 +248,25 @@ class HeuristicTurn(TurnTemplate):
         # For each worker get all possible moves and corresponding build directions
         for worker in workers:
             worker_moves = worker.enumerate_moves(self._board)
+            steps = self._board.get_geometry().step[(worker.x, worker.y)]
             # For each possible move direction and for each possible build direction tied to the move direction..
             for move_dir in worker_moves.keys():
-                for build_dir in worker_moves[move_dir]:
-                    # Calculate where the new x/y coords would be and get that cell
-                    move_x = worker.x + DIRECTION[move_dir]['x']
-                    move_y = worker.y + DIRECTION[move_dir]['y']
-                    build_x = move_x + DIRECTION[build_dir]['x']
-                    build_y = move_y + DIRECTION[build_dir]['y']
-                    move_to_cell = self._board.get_specific_cell(move_x, move_y)
+                # Calculate where the new x/y coords would be and get that cell
+                move_x, move_y = steps[move_dir]
+                move_to_cell = self._board.get_specific_cell(move_x, move_y)
+
+                # Scores only depend on where the worker moves, not where it builds
+                height_score = self._calculate_height_score(worker, move_x, move_y)
+                center_score = self._calculate_center_score(worker, move_x, move_y)
+                distance_score = self._calculate_distance_score(worker, move_x, move_y)
+                move_score = self._calculate_move_score(height_score, center_score, distance_score)
 
+                for build_dir in worker_moves[move_dir]:
                     # If the cell being moved to has a height of 3, don't perform any calculations,
                     # just return moving to that cell as the best direction, as it results in an instant win
-                    if move_to_cell.get_height == 3:
+                    if move_to_cell.get_height() == 3:
                         return [worker, move_dir, build_dir, -1, -1, -1]
 
-                    # Calculate scores
-                    height_score = self._calculate_height_score(worker, move_x, move_y)
-                    center_score = self._calculate_center_score(worker, move_x, move_y)
-                    distance_score = self._calculate_distance_score(worker, move_x, move_y)
-                    move_score = self._calculate_move_score(height_score, center_score, distance_score)
-
                     # Append all possible move scores to list of move scores
                     move_scores.append(move_score)
 
@@ -180,6 +274,8 @@ class HeuristicTurn(TurnTemplate):
                     move_list.append((worker, move_score, move_dir, build_dir, height_score, center_score, distance_score))
         
         # Now that list is populated, find the max move score
+        if not move_scores:
+            return None
         best_move_score = max(move_scores)
 
         # Go through each tuple in move_list, and only add tuples that posses the max move score to best_moves_list
@@ -206,6 +302,60 @@ class HeuristicTurn(TurnTemplate):
 
         return [best_worker, best_move_dir, best_build_dir, height_score, center_score, distance_score]
 
+    def _get_best_move_data_vectorized(self):
+        '''Same as get_best_move_data, but scores every candidate destination in one NumPy pass'''
+        numpy = _numpy()
+        position = self._board.get_bitboard()
+        workers = position.workers
+        first, second = SIDE_WORKERS[side_of(self._player)]
+        opponent_first, opponent_second = (workers[index] for index in SIDE_WORKERS[1 - side_of(self._player)])
+
+        # One row per (worker, destination); the build direction does not affect the scores
+        movers, destinations, others, build_masks = [], [], [], []
+        for index, other in ((first, second), (second, first)):
+            for move_sq, build_mask in position.generate_moves(index):
+                movers.append(index)
+                destinations.append(move_sq)
+                others.append(workers[other])
+                build_masks.append(build_mask)
+        if not destinations:
+            return None
+
+        destinations = numpy.array(destinations)
+        others = numpy.array(others)
+        geometry = position.geometry
+        ring, distance = _geometry_arrays(geometry)
+        levels = numpy.array(position.levels)[:, None]
+        destination_heights = ((levels >> destinations) & 1).sum(axis=0)
+
+        # Moving onto height 3 wins on the spot, as in the scalar path
+        winning_rows = numpy.flatnonzero(destination_heights == 3)
+        if len(winning_rows):
+            row = winning_rows[0]
+            move_sq = int(destinations[row])
+            return [self._player.select_worker(WORKER_NAMES[movers[row]]),
+                    geometry.direction_between[(workers[movers[row]], move_sq)],
+                    geometry.direction_between[(move_sq, next(iter_bits(build_masks[row])))],
+                    -1, -1, -1]
+
+        height_score = destination_heights + ((levels >> others) & 1).sum(axis=0)
+        center_score = ring[destinations] + ring[others]
+        distance_score = geometry.max_distance_score \
+            - (numpy.minimum(distance[destinations, opponent_first], distance[others, opponent_first])
+               + numpy.minimum(distance[destinations, opponent_second], distance[others, opponent_second]))
+        move_score = self._calculate_move_score(height_score, center_score, distance_score)
+
+        # Break ties uniformly over (worker, move, build) combinations, as the scalar path does
+        best_rows = numpy.flatnonzero(move_score == move_score.max())
+        row, build_sq = random.choice([(row, build_sq) for row in best_rows for build_sq in iter_bits(build_masks[row])])
+
+        worker = self._player.select_worker(WORKER_NAMES[movers[row]])
+        move_sq = int(destinations[row])
+        return [worker,
+                geometry.direction_between[(workers[movers[row]], move_sq)],
+                geometry.direction_between[(move_sq, build_sq)],
+                int(height_score[row]), int(center_score[row]), int(distance_score[row])]
+
     # Calculates height score after given worker is moved
     def _calculate_height_score(self, worker, move_x, move_y):
         workers = self._player.get_workers()
@@ -241,7 +391,8 @@ class HeuristicTurn(TurnTemplate):
     # Calculates distance score after given worker is moved
     def _calculate_distance_score(self, worker, move_x, move_y):
         players = self._gui.get_both_players()
-        
+        max_distance_score = self._board.get_geometry().max_distance_score
+
         # Get workers associated with white player
         white_workers = players[0].get_workers()
         worker_A = white_workers[0]
@@ -260,7 +411,7 @@ class HeuristicTurn(TurnTemplate):
             distance_AY = self._calculate_distance((move_x, move_y), (worker_Y.x, worker_Y.y))
             distance_BZ = self._calculate_distance((worker_B.x, worker_B.y), (worker_Z.x, worker_Z.y))
 
-            return 8 - (min(distance_BY, distance_AY) + min(distance_BZ, distance_AZ))
+            return max_distance_score - (min(distance_BY, distance_AY) + min(distance_BZ, distance_AZ))
         elif worker.name == worker_B.name:
             distance_AZ = self._calculate_distance((worker_A.x, worker_A.y), (worker_Z.x, worker_Z.y))
             distance_BY = self._calculate_distance((move_x, move_y), (worker_Y.x, worker_Y.y))
@@ -268,7 +419,7 @@ class HeuristicTurn(TurnTemplate):
             distance_AY = self._calculate_distance((worker_A.x, worker_A.y), (worker_Y.x, worker_Y.y))
             distance_BZ = self._calculate_distance((move_x, move_y), (worker_Z.x, worker_Z.y))
 
-            return 8 - (min(distance_BY, distance_AY) + min(distance_BZ, distance_AZ))
+            return max_distance_score - (min(distance_BY, distance_AY) + min(distance_BZ, distance_AZ))
         elif worker.name == worker_Y.name:
             distance_AZ = self._calculate_distance((worker_A.x, worker_A.y), (worker_Z.x, worker_Z.y))
             distance_BY = self._calculate_distance((worker_B.x, worker_B.y), (move_x, move_y))
@@ -276,7 +427,7 @@ class HeuristicTurn(TurnTemplate):
             distance_AY = self._calculate_distance((worker_A.x, worker_A.y), (move_x, move_y))
             distance_BZ = self._calculate_distance((worker_B.x, worker_B.y), (worker_Z.x, worker_Z.y))
 
-            return 8 - (min(distance_AZ, distance_AY) + min(distance_BY, distance_BZ))
+            return max_distance_score - (min(distance_AZ, distance_AY) + min(distance_BY, distance_BZ))
         elif worker.name == worker_Z.name:
             distance_AZ = self._calculate_distance((worker_A.x, worker_A.y), (move_x, move_y))
             distance_BY = self._calculate_distance((worker_B.x, worker_B.y), (worker_Y.x, worker_Y.y))
@@ -284,11 +435,71 @@ class HeuristicTurn(TurnTemplate):
             distance_AY = self._calculate_distance((worker_A.x, worker_A.y), (worker_Y.x, worker_Y.y))
             distance_BZ = self._calculate_distance((worker_B.x, worker_B.y), (move_x, move_y))
 
-            return 8 - (min(distance_AZ, distance_AY) + min(distance_BY, distance_BZ))
+            return max_distance_score - (min(distance_AZ, distance_AY) + min(distance_BY, distance_BZ))
     
     # Calculates move score using given height, center, and distance score
     def _calculate_move_score(self, height_score, center_score, distance_score):
-        c1, c2, c3 = 3, 2, 1
+        c1, c2, c3 = self._player.settings.get('weights', self.DEFAULT_WEIGHTS)
         return c1 * height_score \
             + c2 * center_score \
-            + c3 * distance_score
\ No newline at end of file
+            + c3 * distance_score
+
+
+class MinimaxTurn(TurnTemplate):
+    '''Searches ahead with alpha-beta minimax and iterative deepening, scoring leaves with the
+    heuristic's height/center/distance terms, and plays the best move found within the
+    player's time budget'''
+    DEFAULT_TIME_BUDGET = 1.0
+
+    def decide(self):
+        action = self._book_action()
+        if action is None:
+            action, _ = self._tactics()
+        if action is not None:
+            return action
+        settings = self._player.settings
+        search = AlphaBetaSearch(settings.get('time_budget', self.DEFAULT_TIME_BUDGET), settings.get('max_depth'),
+                                 self._transposition_table())
+        return search.search(self._board.get_bitboard(), side_of(self._player))
+
+
+class MCTSTurn(TurnTemplate):
+    '''Grows a UCT search tree from random playouts spread across a process pool, and plays
+    the most visited move once the player's iteration count or time budget is spent.
+    With reuse_tree set, the subtree of the position reached is kept for the next turn'''
+    DEFAULT_TIME_BUDGET = 1.0
+
+    def decide(self):
+        action = self._book_action()
+        if action is None:
+            action, _ = self._tactics()
+        if action is not None:
+            return action
+        settings = self._player.settings
+        iterations = settings.get('iterations')
+        time_budget = settings.get('time_budget')
+        if iterations is None and time_budget is None:
+            time_budget = self.DEFAULT_TIME_BUDGET
+        search = MonteCarloTreeSearch(iterations, time_budget, settings.get('processes'),
+                                      vectorized=settings.get('vectorized_playouts', False))
+
+        position = self._board.get_bitboard()
+        side = side_of(self._player)
+        cache = _player_caches.setdefault(self._player, {})
+        root = None
+        if settings.get('reuse_tree') and cache.get('tree') is not None:
+            root = cache['tree'].find(position.key(side))
+        action = search.search(position, side, root)
+        if action is not None and settings.get('reuse_tree'):
+            cache['tree'] = search.root
+        return action
+
+
+# Maps each player type accepted on the command line to its turn template
+PLAYER_TURNS = {
+    'human': HumanTurn,
+    'random': RandomTurn,
+    'heuristic': HeuristicTurn,
+    'minimax': MinimaxTurn,
+    'mcts': MCTSTurn,
+}